@@ -19,10 +19,23 @@ over-engineered:
 For binaries, only the default 0x0 type is supported.
 """
 
+import struct
+from io import BytesIO, FileIO
+
 from .codec import *
+from .compiled import compile_encoder
 from .objectid import ObjectId
 
-__all__ = ["loads", "dumps"]
+__all__ = ["loads", "dumps", "load", "dump", "loads_many", "dumps_many",
+           "dumps_into", "compile_encoder", "get_path", "MISSING", "validate",
+           "loads_columns", "encoded_size", "register_encoder",
+           "register_decoder", "RawBSONDocument", "LazyBSONDocument",
+           "LazyBSONArray", "BufferTooSmall", "InvalidBSON",
+           "UnknownElementType", "MaxDepthExceeded", "set_max_depth",
+           "set_array_key_table_size", "set_cstring_cache_size",
+           "cstring_cache_info", "set_name_cache_size", "name_cache_info",
+           "set_value_cache_size", "value_cache_info", "VECTOR_SUBTYPE",
+           "WIDE_VECTOR_SUBTYPE", "set_wide_vector_decoding"]
 
 
 def dumps(obj, generator=None, on_unknown=None):
@@ -36,15 +49,236 @@ def dumps(obj, generator=None, on_unknown=None):
     if isinstance(obj, BSONCoding):
         return encode_object(obj, [],
                              generator_func=generator, on_unknown=on_unknown)
+    if isinstance(obj, RawBSONDocument):
+        return bytes(obj.raw)
     return encode_document(obj, [],
                            generator_func=generator, on_unknown=on_unknown)
 
 
-def loads(data):
+def _write(buf, obj, generator, on_unknown):
+    if isinstance(obj, BSONCoding):
+        write_object(buf, obj, [], generator, on_unknown)
+    elif isinstance(obj, RawBSONDocument):
+        buf.write(obj.raw)
+    else:
+        write_document(buf, obj, [], generator_func=generator,
+                       on_unknown=on_unknown)
+
+
+def dumps_into(obj, buffer, offset=0, generator=None, on_unknown=None):
+    """
+    Writes obj as a BSON document straight into buffer (a bytearray,
+    memoryview, mmap or any other writable buffer) at offset, and returns
+    the number of bytes written.
+
+    Raises BufferTooSmall, whose required and available attributes give the
+    sizes in bytes counted from offset, if the document does not fit; the
+    buffer contents past offset are unspecified then.
+    """
+    writer = BufferWriter(buffer, offset)
+    try:
+        _write(writer, obj, generator, on_unknown)
+    except BufferTooSmall:
+        raise BufferTooSmall(encoded_size(obj, on_unknown, generator),
+                             len(writer.view) - offset)
+    finally:
+        writer.release()
+    return writer.tell() - offset
+
+
+def dumps_many(objs, generator=None, on_unknown=None, concatenate=False):
+    """
+    Given an iterable of dicts, outputs a list of BSON strings, or a single
+    BSON string holding all of them back to back if concatenate is true.
+
+    All documents are encoded into one shared buffer; generator and on_unknown
+    are used as in dumps.
+    """
+    buf = BytesIO()
+    offsets = [0]
+    for obj in objs:
+        _write(buf, obj, generator, on_unknown)
+        offsets.append(buf.tell())
+    data = buf.getvalue()
+    if concatenate:
+        return data
+    return [data[start:end] for start, end in zip(offsets, offsets[1:])]
+
+
+def dump(obj, fp, generator=None, on_unknown=None):
+    """
+    Writes obj as a BSON document to the binary file fp.
+
+    The document is written as it is encoded. On BytesIO and seekable plain
+    files each length prefix is patched in place afterwards; on other
+    streams, compressed files included, the size of the document is computed
+    up front and it is written one top-level element at a time. generator
+    and on_unknown are used as in dumps.
+    """
+    if _seekable(fp) or isinstance(obj, RawBSONDocument):
+        _write(fp, obj, generator, on_unknown)
+        return
+    fp.write(struct.pack("<i", encoded_size(obj, on_unknown, generator)))
+    parent = None
+    if isinstance(obj, BSONCoding):
+        parent, obj = obj, object_values(obj)
+    for element in iter_elements(obj, [], parent, generator, on_unknown):
+        fp.write(element)
+    fp.write(b"\x00")
+
+
+def _seekable(fp):
+    # Only BytesIO and plain files are trusted to seek back to a length
+    # prefix: compressed streams such as gzip, bz2 and lzma files report
+    # seekable() but refuse backward seeks while writing.
+    if isinstance(fp, BytesIO):
+        return True
+    if not isinstance(getattr(fp, "raw", fp), FileIO):
+        return False
+    # Files opened for appending ignore seek() when writing.
+    mode = getattr(fp, "mode", "")
+    if isinstance(mode, str) and "a" in mode:
+        return False
+    return fp.seekable()
+
+
+def loads(data, raw=False, datetime_mode="aware", hex_object_ids=False,
+          lazy=False, fields=None, intern_keys=False, intern_values=False,
+          packed_arrays=False):
     """
-        Given a BSON string, outputs a dict.
+        Given a BSON string, outputs a dict. data may be bytes, bytearray,
+        memoryview or mmap; it is read in place, without copying.
+
+        If raw is true, outputs a RawBSONDocument wrapping data instead; it
+        is decoded on first access and encoded again by copying data as is.
+
+        datetime_mode selects how UTC datetimes are decoded: "aware" gives
+        datetimes in timezone.utc, "naive" gives naive datetimes in UTC and
+        "millis" gives the int milliseconds since the epoch.
+
+        ObjectIds are decoded as ObjectId instances, or as the hex digits of
+        their 12 bytes if hex_object_ids is true.
+
+        If lazy is true, outputs a LazyBSONDocument over data, which decodes
+        each value only when it is accessed.
+
+        fields, if given, is a set of top-level keys or dotted paths; only
+        these are decoded, and everything else is skipped over. A path
+        continues into each document of an array along it, e.g. "a.b" gives
+        {"a": [{"b": 1}]} for {"a": [{"b": 1, "c": 2}, 3]}.
+
+        If intern_keys is true, keys are taken from a bounded cache keyed on
+        their encoded bytes (see set_name_cache_size), so that documents of
+        the same shape share their key strings instead of each holding its
+        own copies.
+
+        intern_values does the same for string values of at most 64 encoded
+        bytes (see set_value_cache_size). It may also be a set of keys, to
+        intern only the values of fields with those keys, e.g. {"status"}.
+
+        If packed_arrays is true, arrays holding only doubles, or only
+        integers, are decoded as array.arrays of typecode "d", or "i" or "q",
+        instead of lists. array.arrays (and NumPy arrays) are always encoded
+        as BSON arrays.
+    """
+    if fields is not None and (raw or lazy):
+        raise ValueError("fields cannot be combined with raw or lazy")
+    if raw:
+        return RawBSONDocument(data)
+    if lazy:
+        return LazyBSONDocument(data, datetime_mode=datetime_mode,
+                                hex_object_ids=hex_object_ids)
+    return decode_document(data, 0, datetime_mode=datetime_mode,
+                           hex_object_ids=hex_object_ids,
+                           projection=_projection(fields),
+                           intern_keys=intern_keys,
+                           intern_values=intern_values,
+                           packed_arrays=packed_arrays)[1]
+
+
+def _projection(fields):
+    if fields is None:
+        return None
+    return projection_tree(fields)
+
+
+def load(fp, datetime_mode="aware", hex_object_ids=False, fields=None,
+         intern_keys=False, intern_values=False, packed_arrays=False):
+    """
+    Reads exactly one BSON document from the binary file fp and outputs a
+    dict, or None if fp is at end of file. datetime_mode, hex_object_ids,
+    fields, intern_keys, intern_values and packed_arrays are as for loads.
+    """
+    header = _read(fp, 4)
+    if not header:
+        return None
+    length = struct.unpack("<i", header)[0]
+    if length < 5:
+        raise ValueError("invalid document length %d" % (length,))
+    return decode_document(header + _read(fp, length - 4, True), 0,
+                           datetime_mode=datetime_mode,
+                           hex_object_ids=hex_object_ids,
+                           projection=_projection(fields),
+                           intern_keys=intern_keys,
+                           intern_values=intern_values,
+                           packed_arrays=packed_arrays)[1]
+
+
+def _read(fp, size, required=False):
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = fp.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    if remaining and (chunks or required):
+        raise ValueError("truncated BSON document")
+    return b"".join(chunks)
+
+
+def loads_many(data, datetime_mode="aware", hex_object_ids=False,
+               fields=None, intern_keys=False, intern_values=False,
+               packed_arrays=False):
+    """
+    Given a BSON string holding documents back to back, outputs a list of
+    dicts. datetime_mode, hex_object_ids, fields, intern_keys, intern_values
+    and packed_arrays are as for loads.
+    """
+    projection = _projection(fields)
+    if not isinstance(data, (bytes, bytearray)):
+        data = memoryview(data).cast("B")
+    docs = []
+    base = 0
+    end = len(data)
+    while base < end:
+        base, doc = decode_document(data, base, datetime_mode=datetime_mode,
+                                    hex_object_ids=hex_object_ids,
+                                    projection=projection,
+                                    intern_keys=intern_keys,
+                                    intern_values=intern_values,
+                                    packed_arrays=packed_arrays)
+        docs.append(doc)
+    return docs
+
+
+def loads_columns(data, datetime_mode="aware", hex_object_ids=False,
+                  numeric_arrays=True):
+    """
+    Given a BSON string holding documents back to back, outputs a dict
+    mapping each top-level key to the list of its values in the documents,
+    with None for documents that lack it, e.g. {"a": [1, 2], "b": ["x",
+    None]} for [{"a": 1, "b": "x"}, {"a": 2}].
+
+    If numeric_arrays is true, the columns of fields that are all doubles,
+    or all integers of up to 64 bits, are array.arrays instead of lists.
+    Documents of the same shape as the one before them are decoded straight
+    into the columns. datetime_mode and hex_object_ids are as for loads.
     """
-    return decode_document(data, 0)[1]
+    return decode_columns(data, datetime_mode=datetime_mode,
+                          hex_object_ids=hex_object_ids,
+                          numeric_arrays=numeric_arrays)
 
 
 def patch_socket():
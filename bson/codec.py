@@ -6,30 +6,46 @@
 """
 Base codec functions for bson.
 """
+import re
 import struct
+import sys
+from array import array
 import warnings
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from abc import ABCMeta, abstractmethod
+from collections.abc import Mapping, Sequence
 from uuid import UUID
 from decimal import Decimal
+from functools import lru_cache
 
-from bson.types import UInt64, Int64, Int32
+from bson.objectid import ObjectId
+from bson.types import UInt64, Int64, Int32, Vector
 
 try:
     from io import BytesIO as StringIO
 except ImportError:
     from cStringIO import StringIO
 
-import calendar
 from dateutil.tz import tzutc
 from binascii import b2a_hex
 
-from six import integer_types, iterkeys, text_type, PY3
+from six import integer_types, iteritems, text_type
 from six.moves import xrange
 
 
 utc = tzutc()
 
+_EPOCH_AWARE = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_EPOCH_NAIVE = datetime(1970, 1, 1)
+_MILLISECOND = timedelta(milliseconds=1)
+
+_int32_struct = struct.Struct("<i")
+_int64_struct = struct.Struct("<q")
+_uint64_struct = struct.Struct("<Q")
+_double_struct = struct.Struct("<d")
+_char_struct = struct.Struct("<b")
+_int_char_struct = struct.Struct("<iB")
+
 class MissingClassDefinition(ValueError):
     def __init__(self, class_name):
         super(MissingClassDefinition,
@@ -42,6 +58,39 @@ class UnknownSerializerError(ValueError):
               self).__init__("Unable to serialize: key '%s' value: %s type: %s" % (key,value, type(value)))
 
 
+class BufferTooSmall(ValueError):
+    def __init__(self, required, available):
+        self.required = required
+        self.available = available
+        super(BufferTooSmall,
+              self).__init__("Buffer too small: document needs %d bytes, "
+                             "%d available" % (required, available))
+
+
+class UnknownElementType(ValueError):
+    def __init__(self, element_type, name, offset):
+        self.element_type = element_type
+        super(UnknownElementType,
+              self).__init__("Unknown element type 0x%02x of element %r at "
+                             "offset %d" % (element_type, name, offset))
+
+
+class InvalidBSON(ValueError):
+    def __init__(self, reason, offset):
+        self.reason = reason
+        self.offset = offset
+        super(InvalidBSON,
+              self).__init__("Invalid BSON at offset %d: %s" % (offset, reason))
+
+
+class MaxDepthExceeded(ValueError):
+    def __init__(self, max_depth):
+        self.max_depth = max_depth
+        super(MaxDepthExceeded,
+              self).__init__("Documents are nested deeper than the maximum "
+                             "depth of %d" % (max_depth,))
+
+
 class MissingTimezoneWarning(RuntimeWarning):
     def __init__(self, *args):
         args = list(args)
@@ -92,11 +141,24 @@ def import_classes_from_modules(*args):
 
 
 def encode_object(obj, traversal_stack, generator_func, on_unknown=None):
+    buf = StringIO()
+    write_object(buf, obj, traversal_stack, generator_func, on_unknown)
+    return buf.getvalue()
+
+
+def write_object(buf, obj, traversal_stack, generator_func, on_unknown=None):
+    write_document(buf, object_values(obj), traversal_stack, obj,
+                   generator_func, on_unknown)
+
+
+def object_values(obj):
+    """
+    Returns the document a BSONCoding object is encoded as.
+    """
     values = obj.bson_encode()
     class_name = obj.__class__.__name__
     values["$$__CLASS_NAME__$$"] = class_name
-    return encode_document(values, traversal_stack, obj,
-                           generator_func, on_unknown)
+    return values
 
 
 def encode_object_element(name, value, traversal_stack,
@@ -130,7 +192,7 @@ def encode_string(value):
     return struct.pack("<i%dsb" % (length,), length + 1, value, 0)
 
 
-def encode_cstring(value):
+def _encode_cstring(value):
     if not isinstance(value, bytes):
         value = text_type(value).encode("utf-8")
     if b"\x00" in value:
@@ -140,9 +202,102 @@ def encode_cstring(value):
     return value + b"\x00"
 
 
+CSTRING_CACHE_SIZE = 1024
+
+# Element names repeat across documents, so their encoded form is memoized.
+# typed=True keeps e.g. the keys 10 and 10.0 apart.
+encode_cstring = lru_cache(maxsize=CSTRING_CACHE_SIZE, typed=True)(
+    _encode_cstring)
+
+
+def set_cstring_cache_size(maxsize):
+    """
+    Replaces the element name cache with an empty one holding up to maxsize
+    names (None for unbounded, 0 to disable caching).
+
+    Hit rates of the current cache are available from cstring_cache_info().
+    """
+    global encode_cstring
+    encode_cstring = lru_cache(maxsize=maxsize, typed=True)(_encode_cstring)
+
+
+def cstring_cache_info():
+    """
+    Returns (hits, misses, maxsize, currsize) of the element name cache.
+    """
+    return encode_cstring.cache_info()
+
+
+def _decode_name(name):
+    try:
+        return str(name, "utf-8")
+    except UnicodeDecodeError:
+        return bytes(name)
+
+
+NAME_CACHE_SIZE = 4096
+
+# Decoded element names keyed on their raw bytes, used when decoding with
+# intern_keys, so that documents of the same shape share their key strings.
+decode_name = lru_cache(maxsize=NAME_CACHE_SIZE)(_decode_name)
+
+
+def set_name_cache_size(maxsize):
+    """
+    Replaces the decoded element name cache with an empty one holding up to
+    maxsize names (None for unbounded, 0 to disable caching).
+    """
+    global decode_name
+    decode_name = lru_cache(maxsize=maxsize)(_decode_name)
+
+
+def name_cache_info():
+    """
+    Returns (hits, misses, maxsize, currsize) of the decoded element name
+    cache.
+    """
+    return decode_name.cache_info()
+
+
+def _decode_string_value(value):
+    return str(value, "utf-8")
+
+
+INTERNED_VALUE_MAX_SIZE = 64
+
+VALUE_CACHE_SIZE = 4096
+
+# Decoded string values keyed on their raw bytes, used when decoding with
+# intern_values; only values of at most _interned_value_max_size bytes are
+# looked up.
+decode_string_value = lru_cache(maxsize=VALUE_CACHE_SIZE)(
+    _decode_string_value)
+_interned_value_max_size = INTERNED_VALUE_MAX_SIZE
+
+
+def set_value_cache_size(maxsize, max_value_size=INTERNED_VALUE_MAX_SIZE):
+    """
+    Replaces the decoded string value cache with an empty one holding up to
+    maxsize values (None for unbounded, 0 to disable caching), each of at
+    most max_value_size encoded bytes; longer strings are always decoded
+    afresh.
+    """
+    global decode_string_value, _interned_value_max_size
+    decode_string_value = lru_cache(maxsize=maxsize)(_decode_string_value)
+    _interned_value_max_size = max_value_size
+
+
+def value_cache_info():
+    """
+    Returns (hits, misses, maxsize, currsize) of the decoded string value
+    cache.
+    """
+    return decode_string_value.cache_info()
+
+
 def encode_binary(value, binary_subtype=0):
     length = len(value)
-    return struct.pack("<ib", length, binary_subtype) + value
+    return struct.pack("<iB", length, binary_subtype) + value
 
 
 def encode_double(value):
@@ -173,189 +328,1388 @@ def encode_string_element(name, value):
     return b"\x02" + encode_cstring(name) + encode_string(value)
 
 
-def _is_string(value):
-    if isinstance(value, text_type):
-        return True
-    elif isinstance(value, str) or isinstance(value, bytes):
-        try:
-            unicode(value, errors='strict')
-            return True
-        except:
-            pass
-    return False
-
-
 def encode_value(name, value, buf, traversal_stack,
                  generator_func, on_unknown=None):
-    if isinstance(value, bool):
-        buf.write(encode_boolean_element(name, value))
-    elif isinstance(value, integer_types):
-        if value < -0x80000000 or 0x7FFFFFFFFFFFFFFF >= value > 0x7fffffff:
-            buf.write(encode_int64_element(name, value))
-        elif value > 0x7FFFFFFFFFFFFFFF:
-            if value > 0xFFFFFFFFFFFFFFFF:
-                raise Exception("BSON format supports only int value < %s" % 0xFFFFFFFFFFFFFFFF) 
-            buf.write(encode_uint64_element(name, value))
-        else:
-            buf.write(encode_int32_element(name, value))
-    elif isinstance(value, Int32):
-        buf.write(encode_int32_element(name, value.get_value()))
-    elif isinstance(value, Int64):
-        buf.write(encode_int64_element(name, value.get_value()))
-    elif isinstance(value, UInt64):
-        buf.write(encode_uint64_element(name, value.get_value()))
-    elif isinstance(value, float):
-        buf.write(encode_double_element(name, value))
-    elif _is_string(value):
-        buf.write(encode_string_element(name, value))
-    elif isinstance(value, str) or isinstance(value, bytes):
-        buf.write(encode_binary_element(name, value))
-    elif isinstance(value, UUID):
-        buf.write(encode_binary_element(name, value.bytes, binary_subtype=4))
-    elif isinstance(value, datetime):
-        buf.write(encode_utc_datetime_element(name, value))
-    elif value is None:
-        buf.write(encode_none_element(name, value))
-    elif isinstance(value, dict):
-        buf.write(encode_document_element(name, value, traversal_stack,
-                                          generator_func, on_unknown))
-    elif isinstance(value, list) or isinstance(value, tuple):
-        buf.write(encode_array_element(name, value, traversal_stack,
-                                       generator_func, on_unknown))
-    elif isinstance(value, BSONCoding):
-        buf.write(encode_object_element(name, value, traversal_stack,
-                                        generator_func, on_unknown))
-    elif isinstance(value, Decimal):
-        buf.write(encode_double_element(name, float(value)))
-    else:
-        if on_unknown is not None:
-            encode_value(name, on_unknown(value), buf, traversal_stack,
-                         generator_func, on_unknown)
-        else:
-            raise UnknownSerializerError(name, value)
+    _encode_element(encode_cstring(name), value, buf, traversal_stack,
+                    generator_func, on_unknown)
+
+
+def _encode_element(ename, value, buf, traversal_stack,
+                    generator_func, on_unknown):
+    try:
+        encoder = _encoder_cache[type(value)]
+    except KeyError:
+        encoder = _resolve_encoder(type(value))
+    if encoder is None:
+        encoder, value = _replace_unknown(ename, value, on_unknown)
+    encoder(ename, value, buf, traversal_stack, generator_func, on_unknown)
 
 
 def encode_document(obj, traversal_stack, traversal_parent=None,
                     generator_func=None, on_unknown=None):
     buf = StringIO()
-    key_iter = iterkeys(obj)
-    if generator_func is not None:
-        key_iter = generator_func(obj, traversal_stack)
-    for name in key_iter:
-        value = obj[name]
-        traversal_stack.append(TraversalStep(traversal_parent or obj, name))
-        encode_value(name, value, buf, traversal_stack,
-                     generator_func, on_unknown)
-        traversal_stack.pop()
-    e_list = buf.getvalue()
-    e_list_length = len(e_list)
-    return struct.pack("<i%dsb" % (e_list_length,),
-                       e_list_length + 4 + 1, e_list, 0)
+    write_document(buf, obj, traversal_stack, traversal_parent,
+                   generator_func, on_unknown)
+    return buf.getvalue()
 
 
 def encode_array(array, traversal_stack, traversal_parent=None,
                  generator_func=None, on_unknown=None):
     buf = StringIO()
+    write_array(buf, array, traversal_stack, traversal_parent,
+                generator_func, on_unknown)
+    return buf.getvalue()
+
+
+def _begin_document(buf):
+    # Reserve the length prefix; _end_document fills it in once the size of
+    # the document is known, so nested documents are never copied.
+    start = buf.tell()
+    buf.write(b"\x00\x00\x00\x00")
+    return start
+
+
+def _end_document(buf, start):
+    buf.write(b"\x00")
+    end = buf.tell()
+    buf.seek(start)
+    buf.write(_int32_struct.pack(end - start))
+    buf.seek(end)
+
+
+class BufferWriter(object):
+    """
+    A minimal seekable stream writing into a fixed-size buffer in place.
+
+    Writes past the end of the buffer raise BufferTooSmall, with required set
+    to the size the write would have needed.
+    """
+
+    def __init__(self, buffer, offset=0):
+        self.view = memoryview(buffer).cast("B")
+        if not 0 <= offset <= len(self.view):
+            self.view.release()
+            raise ValueError("offset %d out of range" % (offset,))
+        self.pos = offset
+
+    def write(self, data):
+        end = self.pos + len(data)
+        if end > len(self.view):
+            raise BufferTooSmall(end, len(self.view))
+        self.view[self.pos:end] = data
+        self.pos = end
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, pos):
+        self.pos = pos
+
+    def release(self):
+        self.view.release()
+
+
+def write_document(buf, obj, traversal_stack, traversal_parent=None,
+                   generator_func=None, on_unknown=None):
+    """
+    Writes obj as a BSON document to buf at its current position.
+
+    buf may be any seekable binary stream; the length prefix is written as a
+    placeholder and patched in place once the document is complete.
+    """
+    start = _begin_document(buf)
+    _write_elements(buf, _document_elements(obj, traversal_stack,
+                                            traversal_parent, generator_func),
+                    traversal_stack, generator_func, on_unknown)
+    _end_document(buf, start)
+
+
+def iter_elements(obj, traversal_stack, traversal_parent=None,
+                  generator_func=None, on_unknown=None):
+    """
+    Yields the encoded elements of the document obj one at a time, without
+    the length prefix and terminator write_document puts around them.
+    """
+    if generator_func is None:
+        for name, value in iteritems(obj):
+            buf = StringIO()
+            _write_elements(buf, ((encode_cstring(name), value),),
+                            traversal_stack, None, on_unknown)
+            yield buf.getvalue()
+    else:
+        for name in generator_func(obj, traversal_stack):
+            value = obj[name]
+            traversal_stack.append(TraversalStep(traversal_parent or obj,
+                                                 name))
+            buf = StringIO()
+            _write_elements(buf, ((encode_cstring(name), value),),
+                            traversal_stack, generator_func, on_unknown)
+            traversal_stack.pop()
+            yield buf.getvalue()
+
+
+def write_array(buf, array, traversal_stack, traversal_parent=None,
+                generator_func=None, on_unknown=None):
+    start = _begin_document(buf)
+    _write_elements(buf, _array_elements(array, traversal_stack,
+                                         traversal_parent, generator_func),
+                    traversal_stack, generator_func, on_unknown)
+    _end_document(buf, start)
+
+
+def _document_elements(obj, traversal_stack, traversal_parent,
+                       generator_func):
+    # Yields (ename, value) for each element of the document obj.
+    if generator_func is None:
+        # Nothing reads the traversal stack without a generator, so skip it.
+        return zip(map(encode_cstring, obj.keys()), obj.values())
+    return _traverse_document(obj, traversal_stack, traversal_parent,
+                              generator_func)
+
+
+def _traverse_document(obj, traversal_stack, traversal_parent,
+                       generator_func):
+    # The step stays on the stack until the value, including everything
+    # nested in it, has been encoded and the next element is asked for.
+    for name in generator_func(obj, traversal_stack):
+        value = obj[name]
+        traversal_stack.append(TraversalStep(traversal_parent or obj, name))
+        yield encode_cstring(name), value
+        traversal_stack.pop()
+
+
+def _array_elements(array, traversal_stack, traversal_parent,
+                    generator_func):
+    keys = _array_keys
+    if len(array) > len(keys):
+        keys = _grow_array_keys(len(array))
+    if generator_func is None:
+        return zip(keys, array)
+    return _traverse_array(array, keys, traversal_stack, traversal_parent)
+
+
+def _traverse_array(array, keys, traversal_stack, traversal_parent):
     for i in xrange(0, len(array)):
         value = array[i]
         traversal_stack.append(TraversalStep(traversal_parent or array, i))
-        encode_value(str(i), value, buf, traversal_stack,
-                     generator_func, on_unknown)
+        yield keys[i], value
         traversal_stack.pop()
-    e_list = buf.getvalue()
-    e_list_length = len(e_list)
-    return struct.pack("<i%dsb" % (e_list_length,),
-                       e_list_length + 4 + 1, e_list, 0)
+
+
+def _replace_unknown(ename, value, on_unknown):
+    # Returns the encoder of what on_unknown substitutes for value, and that
+    # substitute. on_unknown is consulted only once, so a handler that
+    # returns another unsupported value fails instead of looping forever.
+    if on_unknown is not None:
+        replacement = on_unknown(value)
+        try:
+            encoder = _encoder_cache[type(replacement)]
+        except KeyError:
+            encoder = _resolve_encoder(type(replacement))
+        if encoder is not None:
+            return encoder, replacement
+    raise UnknownSerializerError(ename[:-1].decode("utf-8", "replace"), value)
+
+
+def _write_elements(buf, elements, traversal_stack, generator_func,
+                    on_unknown):
+    # Writes the (ename, value) pairs of elements to buf, descending into
+    # documents, arrays and objects with an explicit stack of the element
+    # iterators and length prefix offsets of the enclosing documents.
+    encoders = _encoder_cache
+    max_depth = _max_depth
+    elements = iter(elements)
+    stack = []
+    while True:
+        for ename, value in elements:
+            try:
+                encoder = encoders[type(value)]
+            except KeyError:
+                encoder = _resolve_encoder(type(value))
+            if encoder is None:
+                encoder, value = _replace_unknown(ename, value, on_unknown)
+            if encoder is _encode_document:
+                children = _document_elements(value, traversal_stack, None,
+                                              generator_func)
+                buf.write(b"\x03" + ename)
+            elif encoder is _encode_array:
+                children = _array_elements(value, traversal_stack, None,
+                                           generator_func)
+                buf.write(b"\x04" + ename)
+            elif encoder is _encode_object:
+                children = _document_elements(object_values(value),
+                                              traversal_stack, value,
+                                              generator_func)
+                buf.write(b"\x03" + ename)
+            else:
+                encoder(ename, value, buf, traversal_stack, generator_func,
+                        on_unknown)
+                continue
+            if len(stack) + 1 >= max_depth:
+                raise MaxDepthExceeded(max_depth)
+            stack.append((elements, _begin_document(buf)))
+            elements = children
+            break
+        else:
+            if not stack:
+                return
+            elements, start = stack.pop()
+            _end_document(buf, start)
+
+
+MAX_DEPTH = 1000
+
+# Documents nested deeper than this, counting the outermost one as depth 1,
+# are refused by the encoder and the decoder.
+_max_depth = MAX_DEPTH
+
+
+def set_max_depth(depth):
+    """
+    Sets how deeply documents and arrays may be nested when encoding or
+    decoding; anything deeper raises MaxDepthExceeded.
+    """
+    global _max_depth
+    if depth < 1:
+        raise ValueError("max depth must be at least 1")
+    _max_depth = depth
+
+
+ARRAY_KEY_TABLE_SIZE = 1024
+
+
+def _make_array_keys(start, stop):
+    return [str(i).encode("ascii") + b"\x00" for i in xrange(start, stop)]
+
+
+# Encoded element names of array indexes: _array_keys[i] == b"<i>\x00".
+_array_keys = _make_array_keys(0, ARRAY_KEY_TABLE_SIZE)
+
+
+def _grow_array_keys(size):
+    # The table is replaced rather than extended in place, so concurrent
+    # encoders always see a consistent list.
+    global _array_keys
+    keys = _array_keys
+    if size > len(keys):
+        keys = keys + _make_array_keys(len(keys), max(size, 2 * len(keys)))
+        _array_keys = keys
+    return keys
+
+
+# type byte -> [type byte + _array_keys[i]]: the element headers of the items
+# of packed numeric arrays, built on first use.
+_packed_headers = {}
+
+
+def _element_headers(type_byte, size):
+    headers = _packed_headers.get(type_byte)
+    if headers is None or len(headers) < size:
+        keys = _array_keys
+        if size > len(keys):
+            keys = _grow_array_keys(size)
+        headers = [type_byte + key for key in keys]
+        _packed_headers[type_byte] = headers
+    return headers
+
+
+def _packed_runs(count):
+    # Yields (first, stop, header size) for the runs of array indexes below
+    # count whose element headers (type byte, name and NUL) are all of the
+    # same size: 0-9, 10-99, 100-999, ...
+    first, stop, size = 0, 10, 3
+    while first < count:
+        yield first, min(stop, count), size
+        first, stop, size = stop, stop * 10, size + 1
+
+
+def set_array_key_table_size(size):
+    """
+    Precomputes the element names of array indexes below size.
+
+    The table still grows on demand when a longer array is encoded.
+    """
+    global _array_keys
+    _array_keys = _make_array_keys(0, size)
+
+
+# Binary subtype of Vectors, as in the BSON vector specification: the data
+# is a dtype byte, a padding byte (0 but for packed bits, which are left as
+# bytes) and the items packed little-endian.
+VECTOR_SUBTYPE = 0x09
+
+# User-defined binary subtype of int32 and float64 Vectors, which the vector
+# subtype has no dtypes for. Same layout, with dtype bytes of our own.
+WIDE_VECTOR_SUBTYPE = 0x80
+
+# array.array typecode of the items -> (binary subtype, dtype byte).
+_VECTOR_DTYPES = {
+    "b": (VECTOR_SUBTYPE, 0x03),
+    "f": (VECTOR_SUBTYPE, 0x27),
+    Vector.TYPECODES["int32"]: (WIDE_VECTOR_SUBTYPE, 0x04),
+    "d": (WIDE_VECTOR_SUBTYPE, 0x28),
+}
+
+# binary subtype -> dtype byte -> array.array typecode of the items.
+_VECTOR_TYPECODES = {}
+for _typecode, (_subtype, _dtype) in _VECTOR_DTYPES.items():
+    _VECTOR_TYPECODES.setdefault(_subtype, {})[_dtype] = _typecode
+del _typecode, _subtype, _dtype
+
+# Other applications may use the user-defined subtype for their own data,
+# so its binaries are only decoded as Vectors when asked to.
+_decode_wide_vectors = False
+
+
+def set_wide_vector_decoding(enabled):
+    """
+    Sets whether binaries of subtype WIDE_VECTOR_SUBTYPE holding int32 or
+    float64 Vectors are decoded as array.arrays; they are left as bytes by
+    default.
+    """
+    global _decode_wide_vectors
+    _decode_wide_vectors = bool(enabled)
 
 
 def decode_binary_subtype(value, binary_subtype):
     if binary_subtype in [0x03, 0x04]:  # legacy UUID, UUID
         return UUID(bytes=value)
+    if binary_subtype == VECTOR_SUBTYPE or \
+            (binary_subtype == WIDE_VECTOR_SUBTYPE and _decode_wide_vectors):
+        return _decode_vector(value, _VECTOR_TYPECODES[binary_subtype])
     return value
 
 
-def decode_document(data, base, as_array=False):
-    # Create all the struct formats we might use.
-    double_struct = struct.Struct("<d")
-    int_struct = struct.Struct("<i")
-    char_struct = struct.Struct("<b")
-    long_struct = struct.Struct("<q")
-    uint64_struct = struct.Struct("<Q")
-    int_char_struct = struct.Struct("<ib")
+def _decode_vector(value, typecodes):
+    # Binaries that are not well-formed vectors of one of the dtypes in
+    # typecodes are left as they are.
+    if len(value) < 2 or value[1] != 0 or value[0] not in typecodes:
+        return value
+    items = array(typecodes[value[0]])
+    if (len(value) - 2) % items.itemsize:
+        return value
+    items.frombytes(memoryview(value)[2:])
+    if sys.byteorder == "big":
+        items.byteswap()
+    return items
 
-    length = struct.unpack("<i", data[base:base + 4])[0]
-    end_point = base + length
-    if data[end_point - 1] not in ('\0', 0):
-        raise ValueError('missing null-terminator in document')
+
+# Element value decoders. Each one is called as decoder(data, base), where
+# base is the offset of the value in data, and returns the value and the
+# offset just past it.
+
+_unpack_double = _double_struct.unpack_from
+_unpack_int = _int32_struct.unpack_from
+_unpack_long = _int64_struct.unpack_from
+_unpack_uint64 = _uint64_struct.unpack_from
+_unpack_int_char = _int_char_struct.unpack_from
+
+
+def _string_end(data, base):
+    length = _unpack_int(data, base)[0]
+    if length < 1:
+        raise ValueError('invalid string length %d at offset %d'
+                         % (length, base))
+    return base + 4 + length
+
+
+def _binary_end(data, base):
+    length = _unpack_int(data, base)[0]
+    if length < 0:
+        raise ValueError('invalid binary length %d at offset %d'
+                         % (length, base))
+    return base + 5 + length
+
+
+def _decode_double(data, base):
+    return _unpack_double(data, base)[0], base + 8
+
+
+def _decode_string(data, base):
+    end = _string_end(data, base)
+    return str(data[base + 4:end - 1], "utf-8"), end
+
+
+def _decode_interned_string(data, base, strings, max_size):
+    end = _string_end(data, base)
+    if end - base - 5 > max_size:
+        return str(data[base + 4:end - 1], "utf-8"), end
+    value = data[base + 4:end - 1]
+    return strings(value if type(value) is bytes else bytes(value)), end
+
+
+def _decode_raw_document(data, base):
+    end = base + _unpack_int(data, base)[0]
+    return RawBSONDocument(data[base:end]), end
+
+
+def _decode_binary(data, base):
+    length, binary_subtype = _unpack_int_char(data, base)
+    if length < 0:
+        raise ValueError('invalid binary length %d at offset %d'
+                         % (length, base))
+    end = base + 5 + length
+    return decode_binary_subtype(bytes(data[base + 5:end]),
+                                 binary_subtype), end
+
+
+_object_id_from_binary = ObjectId._from_binary
+
+
+def _decode_object_id(data, base):
+    return _object_id_from_binary(bytes(data[base:base + 12])), base + 12
+
+
+def _decode_object_id_hex(data, base):
+    return b2a_hex(data[base:base + 12]), base + 12
+
+
+def _decode_boolean(data, base):
+    return data[base] != 0, base + 1
+
+
+def _decode_datetime(data, base):
+    return _EPOCH_AWARE + timedelta(0, 0, 0, _unpack_long(data, base)[0]), \
+        base + 8
+
+
+def _decode_naive_datetime(data, base):
+    return _EPOCH_NAIVE + timedelta(0, 0, 0, _unpack_long(data, base)[0]), \
+        base + 8
+
+
+def _decode_none(data, base):
+    return None, base
+
+
+def _decode_int32(data, base):
+    return _unpack_int(data, base)[0], base + 4
+
+
+def _decode_uint64(data, base):
+    return _unpack_uint64(data, base)[0], base + 8
+
+
+def _decode_int64(data, base):
+    return _unpack_long(data, base)[0], base + 8
+
+
+# Documents (0x03) and arrays (0x04) have no decoder: decode_document descends
+# into them itself.
+_decoders = {
+    0x01: _decode_double,
+    0x02: _decode_string,
+    0x05: _decode_binary,
+    0x07: _decode_object_id,
+    0x08: _decode_boolean,
+    0x09: _decode_datetime,
+    0x0A: _decode_none,
+    0x10: _decode_int32,
+    0x11: _decode_uint64,
+    0x12: _decode_int64,
+}
+
+_DATETIME_DECODERS = {
+    "aware": _decode_datetime,
+    "naive": _decode_naive_datetime,
+    "millis": _decode_int64,
+}
+
+# Decoders registered with register_decoder, which take precedence over the
+# built-in ones and over the decoding options.
+_registered_decoders = {}
+
+# (datetime_mode, hex_object_ids, raw_documents) -> list of the decoders of
+# all 256 type bytes, None where there is none. Built on first use.
+_decoder_tables = {}
+
+
+def _decoder_table(datetime_mode, hex_object_ids, raw_documents):
+    key = (datetime_mode, hex_object_ids, raw_documents)
+    try:
+        return _decoder_tables[key]
+    except KeyError:
+        pass
+    try:
+        datetime_decoder = _DATETIME_DECODERS[datetime_mode]
+    except KeyError:
+        raise ValueError("datetime_mode must be one of %s, not %r"
+                         % (", ".join(sorted(_DATETIME_DECODERS)),
+                            datetime_mode))
+    decoders = dict(_decoders)
+    decoders[0x09] = datetime_decoder
+    if hex_object_ids:
+        decoders[0x07] = _decode_object_id_hex
+    if raw_documents:
+        decoders[0x03] = _decode_raw_document
+    decoders.update(_registered_decoders)
+    table = [decoders.get(element_type) for element_type in xrange(256)]
+    _decoder_tables[key] = table
+    return table
+
+
+def register_decoder(element_type, decoder):
+    """
+    Registers decoder as the decoder of elements of type element_type, in
+    place of the built-in one; None restores the built-in decoder.
+
+    decoder is called as decoder(data, base), where data is the buffer being
+    decoded (bytes, bytearray or a memoryview) and base the offset of the
+    element value in it, and returns the value and the offset just past it,
+    e.g.:
+
+        def decode_binary_as_bytearray(data, base):
+            length = struct.unpack_from("<i", data, base)[0]
+            return bytearray(data[base + 5:base + 5 + length]), \\
+                base + 5 + length
+    """
+    if not 0 <= element_type <= 0xFF:
+        raise ValueError("element type %r out of range" % (element_type,))
+    if decoder is None:
+        _registered_decoders.pop(element_type, None)
+    else:
+        _registered_decoders[element_type] = decoder
+    _decoder_tables.clear()
+
+
+# Type byte -> (array.array typecode, size) of the items of arrays that
+# decode_document can decode as array.arrays.
+_PACKED_TYPES = {
+    0x01: ("d", 8),
+    0x10: ("i", 4),
+    0x12: ("q", 8),
+}
+
+
+def _packed_count(size, width):
+    # Number of items in an array of size bytes (without its length prefix
+    # and terminator) whose items have the keys "0", "1", ... and values of
+    # width bytes, or None if there is no such number.
+    count = 0
+    first, stop, digits = 0, 10, 1
+    while size > 0:
+        item = 2 + digits + width
+        group = (stop - first) * item
+        if size <= group:
+            items, rest = divmod(size, item)
+            return None if rest else count + items
+        size -= group
+        count += stop - first
+        first, stop, digits = stop, stop * 10, digits + 1
+    return count
+
+
+def _read_packed(body, element_type, width):
+    # Returns the values of the array body (without its length prefix and
+    # terminator) packed one after the other, if its elements all have
+    # element_type and the names "0", "1", ..., and None otherwise. Within a
+    # run of same-length names the elements have a fixed stride, so headers
+    # are checked and values gathered one byte column at a time.
+    count = _packed_count(len(body), width)
+    if count is None:
+        return None
+    headers = _element_headers(bytes((element_type,)), count)
+    values = bytearray(count * width)
+    position = 0
+    for first, stop, size in _packed_runs(count):
+        stride = size + width
+        run = body[position:position + (stop - first) * stride]
+        expected = b"".join(headers[first:stop])
+        for k in xrange(size):
+            if run[k::stride] != expected[k::size]:
+                return None
+        for k in xrange(width):
+            values[first * width + k:stop * width:width] = \
+                run[size + k::stride]
+        position += len(run)
+    return values
+
+
+def _decode_packed_array(data, base, limit):
+    # Returns the array at base as an array.array and the offset just past
+    # it if all its items are doubles, or all integers, and None otherwise.
+    end = base + _unpack_int(data, base)[0]
+    if end - base <= 5 or end > limit or data[end - 1] != 0:
+        return None, base
+    element_type = data[base + 4]
+    spec = _PACKED_TYPES.get(element_type)
+    if spec is None:
+        return None, base
+    typecode, width = spec
+    values = _read_packed(bytes(data[base + 4:end - 1]), element_type,
+                          width)
+    if values is not None:
+        items = array(typecode)
+        items.frombytes(values)
+        if sys.byteorder == "big":
+            items.byteswap()
+        return items, end
+    accepted = (0x01,) if element_type == 0x01 else (0x10, 0x12)
+    items = array(typecode)
+    view = not isinstance(data, (bytes, bytearray))
+    base += 4
+    while base < end - 1:
+        element_type = data[base]
+        if element_type not in accepted:
+            return None, base
+        if element_type == 0x12 and items.typecode == "i":
+            items = array("q", items)
+        if view:
+            ll = _cstring_end(data, base + 1)
+        else:
+            ll = data.index(0, base + 1) + 1
+        value, base = _decoders[element_type](data, ll)
+        items.append(value)
+    return items, end
+
+
+def decode_document(data, base, as_array=False, raw_documents=False,
+                    datetime_mode="aware", hex_object_ids=False,
+                    projection=None, intern_keys=False, intern_values=False,
+                    packed_arrays=False):
+    """
+    Decodes the document starting at offset base of data and returns the
+    offset just past it together with the document.
+
+    data may be bytes, bytearray, memoryview or mmap. Fixed-width values are
+    read in place; only strings, binaries and names are copied out of data.
+
+    projection, if given, is a tree built by projection_tree; elements
+    outside of it are skipped without being decoded.
+
+    If intern_keys is true, element names are looked up by their raw bytes
+    in the cache of decode_name, and only decoded on a miss; decoded
+    documents then share their key strings.
+
+    If intern_values is true, short string values are looked up the same way
+    in the cache of decode_string_value. It may also be a set of field
+    names, to intern only the values of those fields; items of arrays are
+    interned only when intern_values is true.
+
+    If packed_arrays is true, arrays of doubles, or of int32 and int64
+    values, are decoded as array.arrays of typecode "d", "i" or "q".
+    """
+    decoders = _decoder_table(datetime_mode, hex_object_ids, raw_documents)
+    view = not isinstance(data, (bytes, bytearray))
+    if view:
+        data = memoryview(data).cast("B")
+    max_depth = _max_depth
+    names = decode_name if intern_keys else None
+    # Strings are only interned where the built-in decoder would be used.
+    strings = None
+    if intern_values and decoders[0x02] is _decode_string:
+        strings = decode_string_value
+        max_size = _interned_value_max_size
+        value_fields = None if intern_values is True else intern_values
+    # Packed arrays are only read where the built-in decoders would be used.
+    packed = packed_arrays and decoders[0x01] is _decode_double and \
+        decoders[0x10] is _decode_int32 and decoders[0x12] is _decode_int64
+
+    end_point = _document_end(data, base)
     base += 4
     retval = [] if as_array else {}
-    decode_name = not as_array
+    # (retval, end_point, as_array, name, projection) of the documents
+    # enclosing the one being decoded.
+    stack = []
+
+    while True:
+        while base < end_point - 1:
+            element_type = data[base]
+
+            if view:
+                ll = _cstring_end(data, base + 1)
+            else:
+                ll = data.index(0, base + 1) + 1
+            if not as_array:
+                name = data[base + 1:ll - 1]
+                if projection is not None:
+                    node = projection.get(name if type(name) is bytes
+                                          else bytes(name))
+                    # Paths that go on below a value that is neither a
+                    # document nor an array do not match it.
+                    if node is None or node is not True and \
+                            element_type != 0x03 and element_type != 0x04:
+                        base = _value_end(data, element_type, ll, decoders)
+                        continue
+                if names is not None:
+                    name = names(name if type(name) is bytes
+                                 else bytes(name))
+                else:
+                    try:
+                        name = str(name, "utf-8")
+                    except UnicodeDecodeError:
+                        name = bytes(name)
+            else:
+                name = None
+                if projection is not None:
+                    # Paths go on into the documents in an array; its other
+                    # items are left out.
+                    if element_type != 0x03 and element_type != 0x04:
+                        base = _value_end(data, element_type, ll, decoders)
+                        continue
+                    node = projection
+
+            decoder = decoders[element_type]
+            if strings is not None and element_type == 0x02 and \
+                    (value_fields is None or
+                     not as_array and name in value_fields):
+                value, base = _decode_interned_string(data, ll, strings,
+                                                      max_size)
+            elif decoder is not None:
+                value, base = decoder(data, ll)
+            elif element_type == 0x03 or element_type == 0x04:
+                # document or array: decoded in place of this one, which is
+                # resumed once the nested one is complete.
+                if len(stack) + 1 >= max_depth:
+                    raise MaxDepthExceeded(max_depth)
+                if packed and element_type == 0x04 and \
+                        (projection is None or node is True):
+                    value, end = _decode_packed_array(data, ll,
+                                                      end_point - 1)
+                    if value is not None:
+                        base = end
+                        if as_array:
+                            retval.append(value)
+                        else:
+                            retval[name] = value
+                        continue
+                stack.append((retval, end_point, as_array, name, projection))
+                if projection is not None:
+                    projection = None if node is True else node
+                end_point = _document_end(data, ll, end_point - 1)
+                base = ll + 4
+                as_array = element_type == 0x04
+                retval = [] if as_array else {}
+                continue
+            else:
+                raise UnknownElementType(element_type, name, base)
+
+            if as_array:
+                retval.append(value)
+            else:
+                retval[name] = value
+
+        if not as_array and "$$__CLASS_NAME__$$" in retval:
+            retval = decode_object(retval)
+        if not stack:
+            return end_point, retval
+        value = retval
+        base = end_point
+        retval, end_point, as_array, name, projection = stack.pop()
+        if as_array:
+            retval.append(value)
+        else:
+            retval[name] = value
 
-    while base < end_point - 1:
 
-        element_type = char_struct.unpack(data[base:base + 1])[0]
+def projection_tree(fields):
+    """
+    Returns the projection tree decode_document takes for fields, a set of
+    top-level keys or dotted paths such as "user.name".
+
+    Each level maps the UTF-8 encoded names to project to either True, for
+    the whole value, or the tree of the paths below that name.
+    """
+    if isinstance(fields, (text_type, bytes)):
+        fields = [fields]
+    tree = {}
+    for field in fields:
+        if isinstance(field, text_type):
+            field = field.encode("utf-8")
+        parts = field.split(b".")
+        node = tree
+        for part in parts[:-1]:
+            child = node.get(part)
+            if child is True:
+                break
+            if child is None:
+                child = node[part] = {}
+            node = child
+        else:
+            node[parts[-1]] = True
+    return tree
 
-        if PY3:
-            ll = data.index(0, base + 1) + 1
+
+def _document_end(data, base, limit=None):
+    # Offset just past the document at base, which must end by limit, the
+    # offset of the terminator of the enclosing document (or the end of
+    # data), so that decoding always moves forward.
+    length = _int32_struct.unpack_from(data, base)[0]
+    end_point = base + length
+    if limit is None:
+        limit = len(data)
+    if length < 5 or end_point > limit:
+        raise ValueError('invalid document length %d at offset %d'
+                         % (length, base))
+    if data[end_point - 1] != 0:
+        raise ValueError('missing null-terminator in document')
+    return end_point
+
+
+_search_nul = re.compile(b"\x00").search
+
+
+def _cstring_end(data, start):
+    # Offset just past the NUL terminating the cstring at start, for buffers
+    # that have no index method.
+    match = _search_nul(data, start)
+    if match is None:
+        raise ValueError("missing null-terminator in element name")
+    return match.end()
+
+
+class RawBSONDocument(Mapping):
+    """
+    A BSON document kept in its encoded form.
+
+    data may be bytes, bytearray, memoryview or mmap. The document is
+    encoded by copying data verbatim, and is only decoded the first time it
+    is read as a mapping, with its own subdocuments as RawBSONDocuments
+    again.
+    """
+
+    __slots__ = ("raw", "_document")
+
+    def __init__(self, data):
+        if len(data) < 5 or \
+                _int32_struct.unpack(data[:4])[0] != len(data) or \
+                data[-1] not in (b"\x00", 0):
+            raise ValueError("data is not a single BSON document")
+        self.raw = data
+        self._document = None
+
+    def _decoded(self):
+        if self._document is None:
+            self._document = decode_document(self.raw, 0,
+                                             raw_documents=True)[1]
+        return self._document
+
+    def __getitem__(self, key):
+        return self._decoded()[key]
+
+    def __iter__(self):
+        return iter(self._decoded())
+
+    def __len__(self):
+        return len(self._decoded())
+
+    def __repr__(self):
+        return "RawBSONDocument(%r)" % (bytes(self.raw),)
+
+
+# Sizes of the values of fixed-width element types.
+_VALUE_SIZES = {
+    0x01: 8,
+    0x07: 12,
+    0x08: 1,
+    0x09: 8,
+    0x0A: 0,
+    0x10: 4,
+    0x11: 8,
+    0x12: 8,
+}
+
+
+def _value_end(data, element_type, base, decoders):
+    # Offset just past the value at base, found without decoding it unless
+    # its size depends on a registered decoder.
+    size = _VALUE_SIZES.get(element_type)
+    if size is not None:
+        return base + size
+    if element_type == 0x02:
+        return _string_end(data, base)
+    if element_type == 0x03 or element_type == 0x04:
+        length = _unpack_int(data, base)[0]
+        if length < 5:
+            raise ValueError('invalid document length %d at offset %d'
+                             % (length, base))
+        return base + length
+    if element_type == 0x05:
+        return _binary_end(data, base)
+    decoder = decoders[element_type]
+    if decoder is None:
+        raise UnknownElementType(element_type, None, base)
+    return decoder(data, base)[1]
+
+
+class _Missing(object):
+    def __repr__(self):
+        return "MISSING"
+
+
+# Returned by get_path for paths that lead nowhere.
+MISSING = _Missing()
+
+
+def get_path(data, path, default=MISSING, datetime_mode="aware",
+             hex_object_ids=False):
+    """
+    Returns the value at the dotted path in the encoded document data, e.g.
+    "a.b.0.c", or default if there is none.
+
+    Only the elements along the path are looked at, and only the value at
+    its end is decoded. data may be bytes, bytearray, memoryview or mmap.
+    datetime_mode and hex_object_ids are as for loads.
+    """
+    decoders = _decoder_table(datetime_mode, hex_object_ids, False)
+    view = not isinstance(data, (bytes, bytearray))
+    if view:
+        data = memoryview(data).cast("B")
+    if isinstance(path, text_type):
+        path = path.encode("utf-8")
+    element_type = 0x03
+    base = 0
+    limit = None
+    for name in path.split(b"."):
+        if element_type != 0x03 and element_type != 0x04:
+            return default
+        end_point = _document_end(data, base, limit)
+        limit = end_point - 1
+        base += 4
+        while base < end_point - 1:
+            element_type = data[base]
+            if view:
+                ll = _cstring_end(data, base + 1)
+            else:
+                ll = data.index(0, base + 1) + 1
+            if ll - base - 2 == len(name) and data[base + 1:ll - 1] == name:
+                base = ll
+                break
+            base = _value_end(data, element_type, ll, decoders)
         else:
-            ll = data.index("\x00", base + 1) + 1
-        if decode_name:
-            name = data[base + 1:ll - 1]
+            return default
+    decoder = decoders[element_type]
+    if decoder is not None:
+        return decoder(data, base)[0]
+    if element_type == 0x03 or element_type == 0x04:
+        return decode_document(data, base, as_array=element_type == 0x04,
+                               datetime_mode=datetime_mode,
+                               hex_object_ids=hex_object_ids)[1]
+    raise UnknownElementType(element_type, path, base)
+
+
+def validate(data, raise_error=False):
+    """
+    Checks that data holds exactly one well-formed BSON document, without
+    decoding it, and returns True or False; if raise_error is true, an
+    invalid document raises InvalidBSON, whose offset attribute locates the
+    problem, instead.
+
+    Lengths and NUL terminators, UTF-8 in names and strings, element types,
+    boolean values, UUID sizes and the nesting depth are checked.
+    """
+    try:
+        _validate(data)
+    except InvalidBSON:
+        if raise_error:
+            raise
+        return False
+    return True
+
+
+def _check_utf8(data, start, end, what):
+    chunk = data[start:end]
+    if type(chunk) is not bytes:
+        chunk = bytes(chunk)
+    if not chunk.isascii():
+        try:
+            chunk.decode("utf-8")
+        except UnicodeDecodeError as exc:
+            raise InvalidBSON("invalid UTF-8 in %s" % (what,),
+                              start + exc.start)
+
+
+def _validate(data):
+    # Walks data with the same grammar as decode_document, bounds-checking
+    # every length against the document it is in.
+    view = not isinstance(data, (bytes, bytearray))
+    if view:
+        data = memoryview(data).cast("B")
+    decoders = _decoder_table("aware", False, False)
+    max_depth = _max_depth
+    if len(data) < 5:
+        raise InvalidBSON("document shorter than 5 bytes", 0)
+    end_point = _unpack_int(data, 0)[0]
+    if end_point != len(data):
+        raise InvalidBSON("document length %d, but %d bytes given"
+                          % (end_point, len(data)), 0)
+    if data[end_point - 1] != 0:
+        raise InvalidBSON("missing null-terminator in document",
+                          end_point - 1)
+    base = 4
+    # End points of the documents enclosing the one being validated.
+    stack = []
+
+    while True:
+        while base < end_point - 1:
+            element_type = data[base]
+            if view:
+                match = _search_nul(data, base + 1, end_point - 1)
+                nul = -1 if match is None else match.start()
+            else:
+                nul = data.find(0, base + 1, end_point - 1)
+            if nul < 0:
+                raise InvalidBSON("missing null-terminator in element name",
+                                  base + 1)
+            _check_utf8(data, base + 1, nul, "element name")
+            ll = nul + 1
+
+            size = _VALUE_SIZES.get(element_type)
+            if size is not None:
+                end = ll + size
+                if element_type == 0x08 and end < end_point and \
+                        data[ll] > 1:
+                    raise InvalidBSON("boolean value %d" % (data[ll],), ll)
+            elif 0x02 <= element_type <= 0x05:
+                if ll + 4 > end_point - 1:
+                    raise InvalidBSON("truncated element length", ll)
+                length = _unpack_int(data, ll)[0]
+                if element_type == 0x02:
+                    end = ll + 4 + length
+                    if length < 1 or end > end_point - 1:
+                        raise InvalidBSON("string length %d out of range"
+                                          % (length,), ll)
+                    if data[end - 1] != 0:
+                        raise InvalidBSON("missing null-terminator in string",
+                                          end - 1)
+                    _check_utf8(data, ll + 4, end - 1, "string")
+                elif element_type == 0x05:
+                    end = ll + 5 + length
+                    if length < 0 or end > end_point - 1:
+                        raise InvalidBSON("binary length %d out of range"
+                                          % (length,), ll)
+                    if data[ll + 4] in (0x03, 0x04) and length != 16:
+                        raise InvalidBSON("UUID of %d bytes" % (length,), ll)
+                else:
+                    end = ll + length
+                    if length < 5 or end > end_point - 1:
+                        raise InvalidBSON("document length %d out of range"
+                                          % (length,), ll)
+                    if data[end - 1] != 0:
+                        raise InvalidBSON("missing null-terminator in "
+                                          "document", end - 1)
+                    if len(stack) + 1 >= max_depth:
+                        raise InvalidBSON("documents nested deeper than %d"
+                                          % (max_depth,), ll)
+                    stack.append(end_point)
+                    end_point = end
+                    base = ll + 4
+                    continue
+            else:
+                decoder = decoders[element_type]
+                if decoder is None:
+                    raise InvalidBSON("unknown element type 0x%02x"
+                                      % (element_type,), base)
+                try:
+                    end = decoder(data, ll)[1]
+                except Exception as exc:
+                    raise InvalidBSON("element type 0x%02x: %s"
+                                      % (element_type, exc), ll)
+            if end > end_point - 1:
+                raise InvalidBSON("element value runs past the end of its "
+                                  "document", ll)
+            base = end
+
+        if not stack:
+            return
+        base = end_point
+        end_point = stack.pop()
+
+
+# array.array typecodes of the columns decode_columns gives numeric fields,
+# keyed on the built-in decoder of their element type.
+_COLUMN_TYPECODES = {
+    _decode_double: "d",
+    _decode_int32: "q",
+    _decode_int64: "q",
+}
+
+
+def _nested_decoder(as_array, datetime_mode, hex_object_ids):
+    def decode(data, base):
+        end, value = decode_document(data, base, as_array=as_array,
+                                     datetime_mode=datetime_mode,
+                                     hex_object_ids=hex_object_ids)
+        return value, end
+    return decode
+
+
+def decode_columns(data, datetime_mode="aware", hex_object_ids=False,
+                   numeric_arrays=True):
+    """
+    Decodes the documents held back to back in data into columns, and
+    returns a dict mapping each top-level key to the list of its values, one
+    per document, with None where a document lacks the key.
+
+    If numeric_arrays is true, columns whose values are all doubles, or all
+    int32 or int64, are array.arrays of typecode "d" or "q" instead.
+
+    The element headers of a document are kept as a layout, and the
+    documents after it are decoded by matching their headers against it
+    byte for byte, without building a dict per document. A document that
+    does not match makes its own layout the current one.
+    """
+    decoders = _decoder_table(datetime_mode, hex_object_ids, False)
+    nested = (_nested_decoder(False, datetime_mode, hex_object_ids),
+              _nested_decoder(True, datetime_mode, hex_object_ids))
+    view = not isinstance(data, (bytes, bytearray))
+    if view:
+        data = memoryview(data).cast("B")
+    columns = {}
+    typecodes = {}
+    # [(element header, decoder, append of its column)] of the current
+    # layout, and the appends of the columns it lacks.
+    layout = None
+    missing = ()
+    rows = 0
+    base = 0
+    end = len(data)
+
+    while base < end:
+        end_point = _document_end(data, base)
+        if layout is not None:
+            position = base + 4
+            for header, decoder, append in layout:
+                if view:
+                    match = data[position:position + len(header)] == header
+                else:
+                    match = data.startswith(header, position)
+                if not match:
+                    break
+                value, position = decoder(data, position + len(header))
+                if position > end_point - 1:
+                    raise ValueError("value of %r runs past the end of the "
+                                     "document at offset %d"
+                                     % (header[1:-1], base))
+                append(value)
+            else:
+                if position == end_point - 1:
+                    for append in missing:
+                        append(None)
+                    rows += 1
+                    base = end_point
+                    continue
+            for column in columns.values():
+                del column[rows:]
+
+        # Builds the layout of this document, whose values are then
+        # decoded by the loop above.
+        layout = []
+        present = set()
+        position = base + 4
+        while position < end_point - 1:
+            element_type = data[position]
+            if view:
+                ll = _cstring_end(data, position + 1)
+            else:
+                ll = data.index(0, position + 1) + 1
+            name = data[position + 1:ll - 1]
             try:
-                name = name.decode("utf-8")
+                name = str(name, "utf-8")
             except UnicodeDecodeError:
-                pass
-        else:
-            name = None
-        base = ll
-
-        if element_type == 0x01:  # double
-            value = double_struct.unpack(data[base: base + 8])[0]
-            base += 8
-        elif element_type == 0x02:  # string
-            length = int_struct.unpack(data[base:base + 4])[0]
-            value = data[base + 4: base + 4 + length - 1]
-            value = value.decode("utf-8")
-            base += 4 + length
-        elif element_type == 0x03:  # document
-            base, value = decode_document(data, base)
-        elif element_type == 0x04:  # array
-            base, value = decode_document(data, base, as_array=True)
-        elif element_type == 0x05:  # binary
-            length, binary_subtype = int_char_struct.unpack(
-                data[base:base + 5])
-            value = data[base + 5:base + 5 + length]
-            value = decode_binary_subtype(value, binary_subtype)
-            base += 5 + length
-        elif element_type == 0x07:  # object_id
-            value = b2a_hex(data[base:base + 12])
-            base += 12
-        elif element_type == 0x08:  # boolean
-            value = bool(char_struct.unpack(data[base:base + 1])[0])
-            base += 1
-        elif element_type == 0x09:  # UTCdatetime
-            value = datetime.fromtimestamp(
-                long_struct.unpack(data[base:base + 8])[0] / 1000.0, utc)
-            base += 8
-        elif element_type == 0x0A:  # none
-            value = None
-        elif element_type == 0x10:  # int32
-            value = int_struct.unpack(data[base:base + 4])[0]
-            base += 4
-        elif element_type == 0x11:  # uint64
-            value = uint64_struct.unpack(data[base:base + 8])[0]
-            base += 8
-        elif element_type == 0x12:  # int64
-            value = long_struct.unpack(data[base:base + 8])[0]
-            base += 8
-
-        if as_array:
-            retval.append(value)
+                name = bytes(name)
+            if name in present:
+                raise ValueError("duplicate key %r in document at offset %d"
+                                 % (name, base))
+            present.add(name)
+            decoder = decoders[element_type]
+            if decoder is None:
+                if element_type != 0x03 and element_type != 0x04:
+                    raise UnknownElementType(element_type, name, position)
+                decoder = nested[element_type == 0x04]
+            typecode = _COLUMN_TYPECODES.get(decoder) \
+                if numeric_arrays else None
+            column = columns.get(name)
+            if column is None:
+                if typecode is not None and not rows:
+                    column = array(typecode)
+                else:
+                    column = [None] * rows
+                columns[name] = column
+                typecodes[name] = typecode
+            elif typecodes[name] is not None and \
+                    typecodes[name] != typecode:
+                column = columns[name] = list(column)
+                typecodes[name] = None
+            layout.append((bytes(data[position:ll]), decoder,
+                           column.append))
+            position = _value_end(data, element_type, ll, decoders)
+            if position > end_point - 1:
+                raise ValueError("value of %r runs past the end of the "
+                                 "document at offset %d" % (name, base))
+        missing = []
+        for name, column in columns.items():
+            if name not in present:
+                if typecodes[name] is not None:
+                    column = columns[name] = list(column)
+                    typecodes[name] = None
+                missing.append(column.append)
+
+    return columns
+
+
+class _LazyElements(object):
+    """
+    The element index and value cache shared by LazyBSONDocument and
+    LazyBSONArray, which hold the buffer, the scan position and the decoder
+    table in their own slots.
+
+    Element headers are scanned only as far as needed to find the key looked
+    up, and the scan resumes from there on the next miss.
+    """
+
+    __slots__ = ()
+
+    def _init(self, data, base, decoders, limit=None):
+        self._data = data
+        self._end = _document_end(data, base, limit)
+        self._next = base + 4
+        self._decoders = decoders
+        self._offsets = [] if isinstance(self, LazyBSONArray) else {}
+        self._values = {}
+
+    def _scan(self, key=None):
+        # Fills self._offsets with key -> (element type, offset of the value)
+        # up to and including the element key, or to the end if key is None.
+        data = self._data
+        decoders = self._decoders
+        offsets = self._offsets
+        as_array = isinstance(offsets, list)
+        view = not isinstance(data, (bytes, bytearray))
+        base = self._next
+        end_point = self._end
+        while base < end_point - 1:
+            element_type = data[base]
+            if view:
+                ll = _cstring_end(data, base + 1)
+            else:
+                ll = data.index(0, base + 1) + 1
+            if as_array:
+                name = len(offsets)
+                offsets.append((element_type, ll))
+            else:
+                name = data[base + 1:ll - 1]
+                try:
+                    name = str(name, "utf-8")
+                except UnicodeDecodeError:
+                    name = bytes(name)
+                offsets[name] = (element_type, ll)
+            base = _value_end(data, element_type, ll, decoders)
+            if name == key:
+                self._next = base
+                return
+        self._next = None
+
+    def _value(self, key, element_type, base):
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        decoder = self._decoders[element_type]
+        if decoder is not None:
+            value = decoder(self._data, base)[0]
+        elif element_type == 0x03:
+            value = LazyBSONDocument._nested(self._data, base,
+                                             self._decoders, self._end - 1)
+        elif element_type == 0x04:
+            value = LazyBSONArray._nested(self._data, base, self._decoders,
+                                          self._end - 1)
         else:
-            retval[name] = value
-    if "$$__CLASS_NAME__$$" in retval:
-        retval = decode_object(retval)
-    return end_point, retval
+            raise UnknownElementType(element_type, key, base)
+        self._values[key] = value
+        return value
+
+    def __len__(self):
+        if self._next is not None:
+            self._scan()
+        return len(self._offsets)
+
+    @classmethod
+    def _nested(cls, data, base, decoders, limit):
+        lazy = cls.__new__(cls)
+        lazy._init(data, base, decoders, limit)
+        lazy.raw = memoryview(data)[base:lazy._end]
+        return lazy
+
+
+class LazyBSONDocument(_LazyElements, RawBSONDocument):
+    """
+    A BSON document decoded one field at a time, as the fields are read.
+
+    Element headers are scanned on demand to find where each value starts;
+    a value is only decoded when it is looked up, and nested documents and
+    arrays are LazyBSONDocuments and LazyBSONArrays over the same buffer.
+    Like a RawBSONDocument, it is encoded by copying its data. Documents
+    encoded from BSONCoding objects are left as documents.
+    """
+
+    __slots__ = ("_data", "_end", "_next", "_decoders", "_offsets",
+                 "_values")
+
+    def __init__(self, data, datetime_mode="aware", hex_object_ids=False):
+        RawBSONDocument.__init__(self, data)
+        if not isinstance(data, (bytes, bytearray)):
+            data = memoryview(data).cast("B")
+        self._init(data, 0, _decoder_table(datetime_mode, hex_object_ids,
+                                           False))
+
+    def __getitem__(self, key):
+        try:
+            element_type, base = self._offsets[key]
+        except KeyError:
+            if self._next is None:
+                raise
+            self._scan(key)
+            element_type, base = self._offsets[key]
+        return self._value(key, element_type, base)
+
+    def __iter__(self):
+        if self._next is not None:
+            self._scan()
+        return iter(self._offsets)
+
+    def __contains__(self, key):
+        if key not in self._offsets and self._next is not None:
+            self._scan(key)
+        return key in self._offsets
+
+    def __repr__(self):
+        return "LazyBSONDocument(%r)" % (bytes(self.raw),)
+
+
+class LazyBSONArray(_LazyElements, Sequence):
+    """
+    A BSON array nested in a LazyBSONDocument, decoded one item at a time.
+
+    It compares equal to lists with the same items, and is encoded by
+    copying its data.
+    """
+
+    __slots__ = ("raw", "_data", "_end", "_next", "_decoders", "_offsets",
+                 "_values")
+
+    def __getitem__(self, index):
+        offsets = self._offsets
+        if isinstance(index, slice):
+            return [self[i] for i in xrange(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+            if index < 0:
+                raise IndexError("array index out of range")
+        elif index >= len(offsets) and self._next is not None:
+            self._scan(index)
+        element_type, base = offsets[index]
+        return self._value(index, element_type, base)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, LazyBSONArray)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "LazyBSONArray(%r)" % (bytes(self.raw),)
 
 
 def encode_document_element(name, value, traversal_stack,
@@ -383,9 +1737,8 @@ def encode_boolean_element(name, value):
 def encode_utc_datetime_element(name, value):
     if value.tzinfo is None:
         warnings.warn(MissingTimezoneWarning(), None, 4)
-    value = int(round(calendar.timegm(value.utctimetuple()) * 1000 +
-                      (value.microsecond / 1000.0)))
-    return b"\x09" + encode_cstring(name) + struct.pack("<q", value)
+    return b"\x09" + encode_cstring(name) + \
+        struct.pack("<q", _datetime_to_millis(value))
 
 
 def encode_none_element(name, value):
@@ -406,4 +1759,483 @@ def encode_int64_element(name, value):
 
 
 def encode_object_id_element(name, value):
+    if isinstance(value, ObjectId):
+        value = value.binary
     return b"\x07" + encode_cstring(name) + value
+
+
+# Element encoders used by encode_value. Each one is called as
+# encoder(ename, value, buf, traversal_stack, generator_func, on_unknown),
+# where ename is the element name already encoded as a NUL-terminated cstring,
+# and writes the complete element (type byte, name and value) to buf.
+
+def _encode_int(ename, value, buf, traversal_stack,
+                generator_func, on_unknown):
+    if -0x80000000 <= value <= 0x7fffffff:
+        buf.write(b"\x10" + ename + _int32_struct.pack(value))
+    elif value <= 0x7FFFFFFFFFFFFFFF:
+        buf.write(b"\x12" + ename + _int64_struct.pack(value))
+    elif value <= 0xFFFFFFFFFFFFFFFF:
+        buf.write(b"\x11" + ename + _uint64_struct.pack(value))
+    else:
+        raise Exception("BSON format supports only int value < %s" % 0xFFFFFFFFFFFFFFFF)
+
+
+def _encode_bool(ename, value, buf, traversal_stack,
+                 generator_func, on_unknown):
+    buf.write(b"\x08" + ename + (b"\x01" if value else b"\x00"))
+
+
+def _encode_int32(ename, value, buf, traversal_stack,
+                  generator_func, on_unknown):
+    buf.write(b"\x10" + ename + _int32_struct.pack(value.get_value()))
+
+
+def _encode_int64(ename, value, buf, traversal_stack,
+                  generator_func, on_unknown):
+    buf.write(b"\x12" + ename + _int64_struct.pack(value.get_value()))
+
+
+def _encode_uint64(ename, value, buf, traversal_stack,
+                   generator_func, on_unknown):
+    buf.write(b"\x11" + ename + _uint64_struct.pack(value.get_value()))
+
+
+def _encode_double(ename, value, buf, traversal_stack,
+                   generator_func, on_unknown):
+    buf.write(b"\x01" + ename + _double_struct.pack(value))
+
+
+def _encode_decimal(ename, value, buf, traversal_stack,
+                    generator_func, on_unknown):
+    buf.write(b"\x01" + ename + _double_struct.pack(float(value)))
+
+
+def _encode_string(ename, value, buf, traversal_stack,
+                   generator_func, on_unknown):
+    value = value.encode("utf-8")
+    buf.write(b"\x02" + ename + _int32_struct.pack(len(value) + 1) +
+              value + b"\x00")
+
+
+def _encode_binary(ename, value, buf, traversal_stack,
+                   generator_func, on_unknown):
+    buf.write(b"\x05" + ename + _int32_struct.pack(len(value)) +
+              b"\x00" + value)
+
+
+def _encode_uuid(ename, value, buf, traversal_stack,
+                 generator_func, on_unknown):
+    buf.write(b"\x05" + ename + b"\x10\x00\x00\x00\x04" + value.bytes)
+
+
+def _encode_object_id(ename, value, buf, traversal_stack,
+                      generator_func, on_unknown):
+    buf.write(b"\x07" + ename + value.binary)
+
+
+def _encode_vector(ename, value, buf, traversal_stack,
+                   generator_func, on_unknown):
+    items = value.get_value()
+    if sys.byteorder == "big":
+        items = array(items.typecode, items)
+        items.byteswap()
+    buf.write(b"\x05" + ename +
+              _int32_struct.pack(2 + len(items) * items.itemsize) +
+              bytes(_VECTOR_DTYPES[items.typecode] + (0,)))
+    buf.write(memoryview(items).cast("B"))
+
+
+def _datetime_to_millis(value):
+    # Integer arithmetic against the epoch; rounds to the nearest millisecond
+    # with ties to even, like round() did on the float timestamp before.
+    if value.utcoffset() is None:
+        millis, rest = divmod(value - _EPOCH_NAIVE, _MILLISECOND)
+    else:
+        millis, rest = divmod(value - _EPOCH_AWARE, _MILLISECOND)
+    rest = rest.microseconds
+    if rest > 500 or (rest == 500 and millis & 1):
+        millis += 1
+    return millis
+
+
+def _encode_datetime(ename, value, buf, traversal_stack,
+                     generator_func, on_unknown):
+    if value.tzinfo is None:
+        warnings.warn(MissingTimezoneWarning(), None, 4)
+    buf.write(b"\x09" + ename + _int64_struct.pack(_datetime_to_millis(value)))
+
+
+def _encode_none(ename, value, buf, traversal_stack,
+                 generator_func, on_unknown):
+    buf.write(b"\x0a" + ename)
+
+
+def _encode_document(ename, value, buf, traversal_stack,
+                     generator_func, on_unknown):
+    buf.write(b"\x03" + ename)
+    write_document(buf, value, traversal_stack,
+                   generator_func=generator_func, on_unknown=on_unknown)
+
+
+def _encode_array(ename, value, buf, traversal_stack,
+                  generator_func, on_unknown):
+    buf.write(b"\x04" + ename)
+    write_array(buf, value, traversal_stack,
+                generator_func=generator_func, on_unknown=on_unknown)
+
+
+def _encode_raw_document(ename, value, buf, traversal_stack,
+                         generator_func, on_unknown):
+    buf.write(b"\x03" + ename)
+    buf.write(value.raw)
+
+
+def _encode_lazy_array(ename, value, buf, traversal_stack,
+                       generator_func, on_unknown):
+    buf.write(b"\x04" + ename)
+    buf.write(value.raw)
+
+
+# Buffer format character -> (type byte, struct code) of packed numeric
+# sequences whose items all encode the same way, where the struct code is
+# that of the values in the encoded elements. Other integer formats are
+# checked for the range of their items first.
+_PACKED_FORMATS = {
+    "d": (b"\x01", "d"),
+    "f": (b"\x01", "d"),
+    "e": (b"\x01", "d"),
+    "b": (b"\x10", "i"),
+    "B": (b"\x10", "i"),
+    "h": (b"\x10", "i"),
+    "H": (b"\x10", "i"),
+    "?": (b"\x08", "?"),
+}
+
+_INTEGER_FORMATS = frozenset("iIlLqQnN")
+
+
+def _packed_type(value):
+    # Returns the type byte all items of the numeric sequence value are
+    # encoded with and the struct code of their values, or None and None if
+    # encode_value would not give them all the same type.
+    view = memoryview(value)
+    if view.ndim != 1:
+        return None, None
+    code = view.format.lstrip("@=<>!")
+    packed = _PACKED_FORMATS.get(code)
+    if packed is not None:
+        return packed
+    if code not in _INTEGER_FORMATS:
+        return None, None
+    if not len(view):
+        return b"\x10", "i"
+    if hasattr(value, "min"):
+        low, high = int(value.min()), int(value.max())
+    else:
+        low, high = min(value), max(value)
+    if -0x80000000 <= low and high <= 0x7fffffff:
+        return b"\x10", "i"
+    if (high < -0x80000000 or 0x7fffffff < low) and \
+            high <= 0x7FFFFFFFFFFFFFFF:
+        return b"\x12", "q"
+    return None, None
+
+
+def _packed_values(value, code):
+    # The items of value packed little-endian as struct code, copied as they
+    # are when they already are.
+    view = memoryview(value)
+    order = view.format[:-1] or "@"
+    if view.format[-1:] == code and view.c_contiguous and \
+            (order == "<" or order in "@=" and sys.byteorder == "little"):
+        return view.tobytes()
+    if hasattr(value, "astype"):
+        # NumPy
+        return value.astype("<" + code).tobytes()
+    items = array(code, value)
+    if sys.byteorder == "big":
+        items.byteswap()
+    return items.tobytes()
+
+
+def _packed_size(count, width):
+    return sum((stop - first) * (size + width)
+               for first, stop, size in _packed_runs(count))
+
+
+def _packed_elements(type_byte, values, width):
+    # Interleaves the element headers of an array of len(values) // width
+    # items with their packed values. Within a run of same-size headers the
+    # elements have a fixed stride, so both are copied in one byte column
+    # at a time.
+    count = len(values) // width
+    headers = _element_headers(type_byte, count)
+    body = bytearray(_packed_size(count, width))
+    position = 0
+    for first, stop, size in _packed_runs(count):
+        stride = size + width
+        end = position + (stop - first) * stride
+        joined = b"".join(headers[first:stop])
+        for k in xrange(size):
+            body[position + k:end:stride] = joined[k::size]
+        for k in xrange(width):
+            body[position + size + k:end:stride] = \
+                values[first * width + k:stop * width:width]
+        position = end
+    return body
+
+
+def _encode_packed_array(ename, value, buf, traversal_stack,
+                         generator_func, on_unknown):
+    # array.array and NumPy arrays: the items share one element type, so
+    # the array is built from its packed values in bulk.
+    type_byte, code = _packed_type(value)
+    if type_byte is None:
+        _encode_array(ename, value.tolist(), buf, traversal_stack,
+                      generator_func, on_unknown)
+        return
+    body = _packed_elements(type_byte, _packed_values(value, code),
+                            struct.calcsize("<" + code))
+    buf.write(b"\x04" + ename + _int32_struct.pack(len(body) + 5))
+    buf.write(body)
+    buf.write(b"\x00")
+
+
+def _encode_object(ename, value, buf, traversal_stack,
+                   generator_func, on_unknown):
+    buf.write(b"\x03" + ename)
+    write_object(buf, value, traversal_stack,
+                 generator_func=generator_func, on_unknown=on_unknown)
+
+
+_encoders = {
+    bool: _encode_bool,
+    Int32: _encode_int32,
+    Int64: _encode_int64,
+    UInt64: _encode_uint64,
+    float: _encode_double,
+    text_type: _encode_string,
+    bytes: _encode_binary,
+    UUID: _encode_uuid,
+    ObjectId: _encode_object_id,
+    datetime: _encode_datetime,
+    type(None): _encode_none,
+    dict: _encode_document,
+    list: _encode_array,
+    tuple: _encode_array,
+    BSONCoding: _encode_object,
+    RawBSONDocument: _encode_raw_document,
+    LazyBSONArray: _encode_lazy_array,
+    Decimal: _encode_decimal,
+    array: _encode_packed_array,
+    Vector: _encode_vector,
+}
+for _int_type in integer_types:
+    _encoders[_int_type] = _encode_int
+
+# The built-in encoders, restored by register_encoder(cls, None).
+_builtin_encoders = dict(_encoders)
+
+# Exact type -> encoder, filled in lazily by _resolve_encoder. Types that have
+# no encoder are cached as None so on_unknown is reached with one lookup too.
+_encoder_cache = dict(_encoders)
+
+
+def _resolve_encoder(cls):
+    encoder = None
+    for base in cls.__mro__:
+        encoder = _encoders.get(base)
+        if encoder is not None:
+            break
+        if base.__name__ == "ndarray" and base.__module__ == "numpy":
+            # Recognized by name, so that NumPy is never imported here.
+            encoder = _encode_packed_array
+            break
+    _encoder_cache[cls] = encoder
+    return encoder
+
+
+def register_encoder(cls, encoder, sizer=None):
+    """
+    Registers encoder as the element encoder for cls and its subclasses.
+
+    encoder is called as encoder(ename, value, buf, traversal_stack,
+    generator_func, on_unknown), where ename is the element name already
+    encoded as a NUL-terminated cstring. It must write the complete element,
+    starting with its type byte, to buf, e.g.:
+
+        def encode_point(ename, value, buf, *args):
+            buf.write(b"\\x02" + ename + encode_string(str(value)))
+
+    sizer, if given, is called as sizer(value, on_unknown) by encoded_size and
+    returns the size of what encoder writes after ename. Without one,
+    encoded_size measures the element by encoding it.
+
+    An encoder of None removes the one registered for cls, restoring the
+    built-in encoder if there is one.
+    """
+    previous = _encoders.get(cls)
+    if encoder is None:
+        builtin = _builtin_encoders.get(cls)
+        if builtin is None:
+            _encoders.pop(cls, None)
+        else:
+            _encoders[cls] = builtin
+    else:
+        _encoders[cls] = encoder
+    if previous is not None and previous not in _encoders.values() and \
+            previous not in _builtin_encoders.values():
+        _sizers.pop(previous, None)
+    _encoder_cache.clear()
+    _encoder_cache.update(_encoders)
+    if sizer is not None and encoder is not None:
+        _sizers[encoder] = sizer
+
+
+# Sizes of element values, keyed by the encoder that writes them, so that
+# encoded_size follows exactly the same type rules as encode_value. Each one
+# is called as sizer(value, on_unknown).
+
+def _size_int(value, on_unknown):
+    if -0x80000000 <= value <= 0x7fffffff:
+        return 4
+    if value > 0xFFFFFFFFFFFFFFFF:
+        raise Exception("BSON format supports only int value < %s" % 0xFFFFFFFFFFFFFFFF)
+    return 8
+
+
+def _size_string(value, on_unknown):
+    if value.isascii():
+        return len(value) + 5
+    return len(value.encode("utf-8")) + 5
+
+
+def _size_binary(value, on_unknown):
+    return len(value) + 5
+
+
+def _size_document(value, on_unknown):
+    return _size_elements(_document_elements(value, None, None, None),
+                          on_unknown)
+
+
+def _size_array(value, on_unknown):
+    return _size_elements(_array_elements(value, None, None, None),
+                          on_unknown)
+
+
+def _size_packed_array(value, on_unknown):
+    type_byte, code = _packed_type(value)
+    if type_byte is None:
+        return _size_array(value.tolist(), on_unknown)
+    return 5 + _packed_size(len(value), struct.calcsize("<" + code))
+
+
+def _size_vector(value, on_unknown):
+    items = value.get_value()
+    return 7 + len(items) * items.itemsize
+
+
+def _size_object(value, on_unknown):
+    return _size_document(object_values(value), on_unknown)
+
+
+def _size_elements(elements, on_unknown, traversal_stack=None,
+                   generator_func=None):
+    # Returns the size of a document holding the (ename, value) pairs of
+    # elements, walking nested documents the same way _write_elements does,
+    # so that generator_func sees the same traversal stack.
+    encoders = _encoder_cache
+    max_depth = _max_depth
+    elements = iter(elements)
+    stack = []
+    size = 5
+    while True:
+        for ename, value in elements:
+            try:
+                encoder = encoders[type(value)]
+            except KeyError:
+                encoder = _resolve_encoder(type(value))
+            if encoder is None:
+                encoder, value = _replace_unknown(ename, value, on_unknown)
+            if encoder is _encode_document:
+                children = _document_elements(value, traversal_stack, None,
+                                              generator_func)
+            elif encoder is _encode_array:
+                children = _array_elements(value, traversal_stack, None,
+                                           generator_func)
+            elif encoder is _encode_object:
+                children = _document_elements(object_values(value),
+                                              traversal_stack, value,
+                                              generator_func)
+            else:
+                size += _leaf_size(ename, value, encoder, on_unknown)
+                continue
+            if len(stack) + 1 >= max_depth:
+                raise MaxDepthExceeded(max_depth)
+            stack.append(elements)
+            size += 6 + len(ename)
+            elements = children
+            break
+        else:
+            if not stack:
+                return size
+            elements = stack.pop()
+
+
+def _fixed_size(size):
+    return lambda value, on_unknown: size
+
+
+_sizers = {
+    _encode_int: _size_int,
+    _encode_bool: _fixed_size(1),
+    _encode_int32: _fixed_size(4),
+    _encode_int64: _fixed_size(8),
+    _encode_uint64: _fixed_size(8),
+    _encode_double: _fixed_size(8),
+    _encode_decimal: _fixed_size(8),
+    _encode_string: _size_string,
+    _encode_binary: _size_binary,
+    _encode_uuid: _fixed_size(21),
+    _encode_object_id: _fixed_size(12),
+    _encode_datetime: _fixed_size(8),
+    _encode_none: _fixed_size(0),
+    _encode_document: _size_document,
+    _encode_array: _size_array,
+    _encode_object: _size_object,
+    _encode_packed_array: _size_packed_array,
+    _encode_vector: _size_vector,
+    _encode_raw_document: lambda value, on_unknown: len(value.raw),
+    _encode_lazy_array: lambda value, on_unknown: len(value.raw),
+}
+
+
+def _leaf_size(ename, value, encoder, on_unknown):
+    sizer = _sizers.get(encoder)
+    if sizer is None:
+        buf = StringIO()
+        encoder(ename, value, buf, [], None, on_unknown)
+        return buf.tell()
+    return 1 + len(ename) + sizer(value, on_unknown)
+
+
+def encoded_size(obj, on_unknown=None, generator=None):
+    """
+    Returns len(dumps(obj, generator=generator, on_unknown=on_unknown))
+    without encoding obj.
+    """
+    if isinstance(obj, RawBSONDocument):
+        return len(obj.raw)
+    if generator is None:
+        if isinstance(obj, BSONCoding):
+            return _size_object(obj, on_unknown)
+        return _size_document(obj, on_unknown)
+    traversal_stack = []
+    parent = None
+    if isinstance(obj, BSONCoding):
+        parent, obj = obj, object_values(obj)
+    return _size_elements(_document_elements(obj, traversal_stack, parent,
+                                             generator),
+                          on_unknown, traversal_stack, generator)
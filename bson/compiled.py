@@ -0,0 +1,241 @@
+"""
+Encoders specialized for documents of a fixed shape.
+
+compile_encoder generates the source of an encoder function for one document
+layout, the same way collections.namedtuple builds its classes: element names,
+type bytes and the struct formats of the fixed-width fields become constants
+of the generated function, which leaves only the per-value work at run time.
+"""
+import struct
+import warnings
+from datetime import datetime
+from decimal import Decimal
+from uuid import UUID
+
+from six import integer_types, iteritems, text_type
+
+from bson.codec import (BSONCoding, MissingTimezoneWarning, encode_cstring,
+                        encode_document, encode_object, encode_value,
+                        _datetime_to_millis)
+from bson.objectid import ObjectId
+from bson.types import Int32, Int64, UInt64
+
+try:
+    from io import BytesIO as StringIO
+except ImportError:
+    from cStringIO import StringIO
+
+
+def _datetime_millis(value):
+    if value.tzinfo is None:
+        warnings.warn(MissingTimezoneWarning(), None, 3)
+    return _datetime_to_millis(value)
+
+
+# type -> (element type byte, constant value prefix, struct code, value
+# expression); "%s" in the expression stands for the field's variable.
+_FIXED_FIELDS = {
+    bool: (b"\x08", b"", "?", "%s"),
+    float: (b"\x01", b"", "d", "%s"),
+    Decimal: (b"\x01", b"", "d", "float(%s)"),
+    Int32: (b"\x10", b"", "i", "%s.get_value()"),
+    Int64: (b"\x12", b"", "q", "%s.get_value()"),
+    UInt64: (b"\x11", b"", "Q", "%s.get_value()"),
+    datetime: (b"\x09", b"", "q", "_datetime_millis(%s)"),
+    UUID: (b"\x05", b"\x10\x00\x00\x00\x04", "16s", "%s.bytes"),
+    ObjectId: (b"\x07", b"", "12s", "%s.binary"),
+    type(None): (b"\x0a", b"", None, None),
+}
+
+# Plain ints get the narrowest type encode_value would pick for them, and a
+# compiled field only matches values that encode_value gives the same type:
+# struct code -> (type byte, range test).
+_INT_FIELDS = {
+    "i": (b"\x10", "-0x80000000 <= %(v)s <= 0x7fffffff"),
+    "q": (b"\x12", "(%(v)s < -0x80000000 or 0x7fffffff < %(v)s) and "
+                   "-0x8000000000000000 <= %(v)s <= 0x7FFFFFFFFFFFFFFF"),
+    "Q": (b"\x11", "0x7FFFFFFFFFFFFFFF < %(v)s <= 0xFFFFFFFFFFFFFFFF"),
+}
+
+
+def _int_code(value):
+    if -0x80000000 <= value <= 0x7fffffff:
+        return "i"
+    if -0x8000000000000000 <= value <= 0x7FFFFFFFFFFFFFFF:
+        return "q"
+    if 0 <= value <= 0xFFFFFFFFFFFFFFFF:
+        return "Q"
+    raise ValueError("BSON format supports only int value < %s"
+                     % 0xFFFFFFFFFFFFFFFF)
+
+
+def _generic_element(name):
+    def encode(value):
+        buf = StringIO()
+        encode_value(name, value, buf, [], None)
+        return buf.getvalue()
+    return encode
+
+
+def _fallback(obj):
+    if isinstance(obj, BSONCoding):
+        return encode_object(obj, [], None)
+    return encode_document(obj, [])
+
+
+class _Layout(object):
+    """
+    The element layout of a compiled document.
+
+    The document is a list of items: ("const", bytes), ("value", struct code,
+    expression) and ("chunk", expression). Consecutive consts and values are
+    packed by one struct.Struct; chunks are byte strings of variable length
+    computed in the prelude of the generated function.
+    """
+
+    def __init__(self):
+        self.namespace = {
+            "_datetime_millis": _datetime_millis,
+            "_fallback": _fallback,
+        }
+        self.checks = []
+        self.prelude = []
+        self.items = []
+        self.chunks = []
+
+    def add_global(self, prefix, value):
+        name = "_%s%d" % (prefix, len(self.namespace))
+        self.namespace[name] = value
+        return name
+
+    def const(self, value):
+        if self.items and self.items[-1][0] == "const":
+            value = self.items.pop()[1] + value
+        self.items.append(("const", value))
+
+    def value(self, code, expression):
+        self.items.append(("value", code, expression))
+
+    def chunk(self, expression):
+        self.items.append(("chunk", expression))
+        self.chunks.append(expression)
+
+    def fixed_size(self):
+        consts = [item[1] for item in self.items if item[0] == "const"]
+        codes = [item[1] for item in self.items if item[0] == "value"]
+        return sum(len(const) for const in consts) + \
+            struct.calcsize("<" + "".join(codes))
+
+    def pack_calls(self):
+        calls = []
+        fmt, args = "<", []
+        for item in self.items + [("chunk", None)]:
+            if item[0] == "const":
+                fmt += "%ds" % (len(item[1]),)
+                args.append(self.add_global("c", item[1]))
+            elif item[0] == "value":
+                fmt += item[1]
+                args.append(item[2])
+            else:
+                if args:
+                    pack = struct.Struct(fmt).pack
+                    calls.append("%s(%s)" % (self.add_global("s", pack),
+                                             ", ".join(args)))
+                    fmt, args = "<", []
+                if item[1] is not None:
+                    calls.append(item[1])
+        return calls
+
+
+def _compile_fields(layout, template):
+    keys = []
+    types = []
+    for index, (name, value) in enumerate(iteritems(template)):
+        var = "v%d" % (index,)
+        ename = encode_cstring(name)
+        cls = value if isinstance(value, type) else type(value)
+        keys.append(name)
+        types.append(cls)
+        if cls in integer_types:
+            code = "i" if cls is value else _int_code(value)
+            type_byte, test = _INT_FIELDS[code]
+            layout.checks.append(test % {"v": var})
+            layout.const(type_byte + ename)
+            layout.value(code, var)
+        elif cls in _FIXED_FIELDS:
+            type_byte, prefix, code, expression = _FIXED_FIELDS[cls]
+            layout.const(type_byte + ename + prefix)
+            if code is not None:
+                layout.value(code, expression % (var,))
+        elif cls is text_type:
+            layout.prelude.append("b%d = %s.encode('utf-8')" % (index, var))
+            layout.const(b"\x02" + ename)
+            layout.value("i", "len(b%d) + 1" % (index,))
+            layout.chunk("b%d" % (index,))
+            layout.const(b"\x00")
+        elif cls is bytes:
+            layout.const(b"\x05" + ename)
+            layout.value("i", "len(%s)" % (var,))
+            layout.const(b"\x00")
+            layout.chunk(var)
+        elif cls is dict and cls is not value:
+            encoder = layout.add_global("e", compile_encoder(value))
+            layout.prelude.append("e%d = %s(%s)" % (index, encoder, var))
+            layout.const(b"\x03" + ename)
+            layout.chunk("e%d" % (index,))
+        else:
+            encoder = layout.add_global("e", _generic_element(name))
+            layout.prelude.append("e%d = %s(%s)" % (index, encoder, var))
+            layout.chunk("e%d" % (index,))
+    return keys, types
+
+
+def compile_encoder(template):
+    """
+    Returns a function that encodes documents shaped like template.
+
+    template is either an example document or a schema mapping keys to types,
+    e.g. {"id": int, "name": text_type, "score": float}. In a schema, int
+    stands for values that fit in 32 bits; give an example value to compile a
+    64-bit field instead. Nested dicts are compiled as well.
+
+    Documents with other keys, key order or value types are handed to the
+    generic encoder, so the result always equals dumps(obj).
+    """
+    layout = _Layout()
+    layout.value("i", None)
+    keys, types = _compile_fields(layout, template)
+    layout.const(b"\x00")
+    layout.namespace["_keys"] = tuple(keys)
+    layout.namespace["_types"] = tuple(types)
+    # The length prefix is the fixed part of the document plus its chunks.
+    layout.items[0] = ("value", "i", " + ".join(
+        [str(layout.fixed_size())] + ["len(%s)" % (chunk,)
+                                      for chunk in layout.chunks]))
+    calls = layout.pack_calls()
+
+    variables = ["v%d" % (i,) for i in range(len(keys))]
+    match = "type(obj) is dict and tuple(obj) == _keys"
+    if any(type(key) is not text_type for key in keys):
+        # 1, 1.0 and True are equal keys, but have different element names.
+        layout.namespace["_key_types"] = tuple(type(key) for key in keys)
+        match += " and tuple(map(type, obj)) == _key_types"
+    lines = ["def encode(obj):", "    if %s:" % (match,)]
+    indent = "        "
+    if variables:
+        types_check = "(%s,) == _types" % (
+            ", ".join("type(%s)" % (var,) for var in variables),)
+        lines.append(indent + "%s, = obj.values()" % (", ".join(variables),))
+        lines.append(indent + "if %s:" % (
+            " and ".join([types_check] + layout.checks),))
+        indent += "    "
+    lines.extend(indent + line for line in layout.prelude)
+    if len(calls) == 1:
+        lines.append(indent + "return %s" % (calls[0],))
+    else:
+        lines.append(indent + "return b''.join((%s,))" % (", ".join(calls),))
+    lines.append("    return _fallback(obj)")
+
+    source = "\n".join(lines)
+    exec(compile(source, "<compiled encoder>", "exec"), layout.namespace)
+    return layout.namespace["encode"]
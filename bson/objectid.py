@@ -179,6 +179,15 @@ class ObjectId(object):
         except (InvalidId, TypeError):
             return False
 
+    @classmethod
+    def _from_binary(cls, oid):
+        """Create an ObjectId from 12 bytes that are already known to be
+        valid, such as those read from a BSON document.
+        """
+        self = cls.__new__(cls)
+        self.__id = oid
+        return self
+
     def __generate(self):
         """Generate a new value for this ObjectId.
         """
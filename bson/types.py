@@ -1,3 +1,7 @@
+import sys
+from array import array
+
+
 class Int32:
     """
     A signed integer with a 32-bit fixed width.
@@ -47,3 +51,70 @@ class UInt64:
 
     def __str__(self):
         return str(self._value)
+
+
+_NATIVE_ORDER = "<" if sys.byteorder == "little" else ">"
+
+
+def _native_format(values):
+    # The struct format character of the items of values, if it is a flat,
+    # contiguous buffer of items in native byte order, and None otherwise.
+    try:
+        view = memoryview(values)
+    except TypeError:
+        return None
+    code = view.format
+    if code[:1] in ("@", "=", _NATIVE_ORDER):
+        code = code[1:]
+    if view.ndim != 1 or not view.c_contiguous or len(code) != 1:
+        return None
+    return code
+
+
+# The array.array typecode of 4-byte signed integers.
+_INT32_TYPECODE = "i" if array("i").itemsize == 4 else "l"
+
+
+class Vector:
+    """
+    A numeric sequence encoded as a single binary element holding a dtype
+    header and the packed values, in place of a BSON array.
+
+    dtype is "int8" or "float32", the numeric dtypes of the BSON vector
+    subtype 0x09, or "int32" or "float64", which that subtype lacks and are
+    stored under the user-defined subtype bson.WIDE_VECTOR_SUBTYPE instead.
+    It may be left out for an array.array or NumPy array of one of these
+    types. Other numbers are converted, e.g. Vector(values, "float32")
+    stores float64 values as float32. Vectors are decoded as array.arrays;
+    those of the user-defined subtype only after
+    bson.set_wide_vector_decoding(True).
+    """
+
+    TYPECODES = {"int8": "b", "float32": "f", "int32": _INT32_TYPECODE,
+                 "float64": "d"}
+
+    def __init__(self, values, dtype=None):
+        code = _native_format(values)
+        if dtype is None:
+            for dtype, typecode in self.TYPECODES.items():
+                if code == typecode:
+                    break
+            else:
+                raise ValueError('the dtype of {!r} must be given'.format(values))
+        try:
+            typecode = self.TYPECODES[dtype]
+        except KeyError:
+            raise ValueError('dtype {!r} cannot be encoded as a vector'.format(dtype))
+        if isinstance(values, array) and values.typecode == typecode:
+            self._value = values
+        elif code == typecode:
+            self._value = array(typecode)
+            self._value.frombytes(values)
+        else:
+            self._value = array(typecode, values)
+
+    def get_value(self):
+        return self._value
+
+    def __str__(self):
+        return str(self._value.tolist())
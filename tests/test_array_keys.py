@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+from unittest import TestCase
+
+from bson import dumps, loads, set_array_key_table_size
+from bson.codec import ARRAY_KEY_TABLE_SIZE
+
+
+class TestArrayKeys(TestCase):
+    def tearDown(self):
+        set_array_key_table_size(ARRAY_KEY_TABLE_SIZE)
+
+    def test_index_keys(self):
+        self.assertEqual(dumps({"a": [True, False]}),
+                         b'\x15\x00\x00\x00\x04a\x00\r\x00\x00\x00'
+                         b'\x080\x00\x01\x081\x00\x00\x00\x00')
+
+    def test_grow_on_demand(self):
+        set_array_key_table_size(2)
+        doc = {"samples": list(range(5000)), "nested": [[1, 2, 3]]}
+        self.assertEqual(loads(dumps(doc)), doc)
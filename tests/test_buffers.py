@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+import mmap
+from datetime import datetime, timezone
+from unittest import TestCase
+from uuid import UUID
+
+from bson import dumps, loads, loads_many
+from bson.objectid import ObjectId
+
+
+DOC = {
+    "name": u"café",
+    "n": 1,
+    "big": 2 ** 40,
+    "f": 1.5,
+    "t": True,
+    "none": None,
+    "bin": b"\x00\x01\x02",
+    "uuid": UUID("584bcd8f-6d81-485a-bac9-629c14b53847"),
+    "oid": ObjectId(b"foo-bar-quux"),
+    "when": datetime(2020, 1, 1, tzinfo=timezone.utc),
+    "list": [1, u"two", {"three": [3.0]}],
+    u"café": {},
+}
+
+
+class TestBuffers(TestCase):
+    def setUp(self):
+        self.serialized = dumps(DOC)
+
+    def check(self, data):
+        decoded = loads(data)
+        self.assertEqual(decoded, DOC)
+        self.assertIs(type(decoded["bin"]), bytes)
+        self.assertEqual(loads_many(data), [DOC])
+
+    def test_bytearray(self):
+        self.check(bytearray(self.serialized))
+
+    def test_memoryview(self):
+        self.check(memoryview(self.serialized))
+        self.check(memoryview(bytearray(self.serialized)))
+
+    def test_memoryview_offset(self):
+        padded = b"\xff" * 3 + self.serialized + b"\xff"
+        self.check(memoryview(padded)[3:-1])
+
+    def test_memoryview_cast(self):
+        self.check(memoryview(self.serialized).cast("c"))
+
+    def test_mmap(self):
+        data = mmap.mmap(-1, len(self.serialized) * 2)
+        try:
+            data.write(self.serialized * 2)
+            self.assertEqual(loads(data), DOC)
+            self.assertEqual(loads_many(data), [DOC, DOC])
+        finally:
+            data.close()
+
+    def test_raw(self):
+        raw = loads(memoryview(self.serialized), raw=True)
+        self.assertEqual(raw["list"][2]["three"], [3.0])
+        self.assertEqual(dumps(raw), self.serialized)
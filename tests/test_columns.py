@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+from array import array
+from unittest import TestCase
+
+from bson import dumps, dumps_many, loads_columns
+
+
+class TestColumns(TestCase):
+    def columns(self, docs, **kwargs):
+        data = dumps_many(docs, concatenate=True)
+        columns = loads_columns(data, **kwargs)
+        for buf in (bytearray(data), memoryview(data)):
+            self.assertEqual(loads_columns(buf, **kwargs), columns)
+        return columns
+
+    def test_same_shape(self):
+        docs = [{u"id": i, u"x": i / 2.0, u"name": u"doc%d" % i,
+                 u"tags": [i], u"sub": {u"n": i}} for i in range(50)]
+        columns = self.columns(docs)
+        self.assertEqual(list(columns), [u"id", u"x", u"name", u"tags",
+                                         u"sub"])
+        self.assertEqual(columns[u"id"], array("q", range(50)))
+        self.assertEqual(columns[u"x"], array("d", [i / 2.0
+                                                    for i in range(50)]))
+        self.assertEqual(columns[u"name"], [u"doc%d" % i for i in range(50)])
+        self.assertEqual(columns[u"tags"], [[i] for i in range(50)])
+        self.assertEqual(columns[u"sub"], [{u"n": i} for i in range(50)])
+
+    def test_lists(self):
+        columns = self.columns([{u"id": 1}, {u"id": 2}],
+                               numeric_arrays=False)
+        self.assertEqual(columns, {u"id": [1, 2]})
+
+    def test_int_widths(self):
+        columns = self.columns([{u"id": 1}, {u"id": 2 ** 40}, {u"id": -3}])
+        self.assertEqual(columns[u"id"], array("q", [1, 2 ** 40, -3]))
+
+    def test_shape_changes(self):
+        docs = [{u"a": 1, u"b": u"x"}, {u"a": 2, u"b": u"y"},
+                {u"b": u"z", u"a": 3}, {u"a": 4.5}, {u"c": None},
+                {u"a": 5, u"b": u"w"}]
+        columns = self.columns(docs)
+        self.assertEqual(columns, {
+            u"a": [1, 2, 3, 4.5, None, 5],
+            u"b": [u"x", u"y", u"z", None, None, u"w"],
+            u"c": [None] * 6,
+        })
+
+    def test_extra_field(self):
+        columns = self.columns([{u"a": 1}, {u"a": 2, u"b": 3}, {u"a": 4}])
+        self.assertEqual(columns, {u"a": array("q", [1, 2, 4]),
+                                   u"b": [None, 3, None]})
+
+    def test_empty(self):
+        self.assertEqual(loads_columns(b""), {})
+        self.assertEqual(self.columns([{}, {}]), {})
+
+    def test_duplicate_key(self):
+        data = b"\x0b\x00\x00\x00\x0aa\x00\x0aa\x00\x00"
+        with self.assertRaises(ValueError):
+            loads_columns(data)
+        self.assertEqual(loads_columns(dumps({u"a": None})), {u"a": [None]})
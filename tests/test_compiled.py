@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+from datetime import datetime
+from decimal import Decimal
+from unittest import TestCase
+from uuid import UUID
+
+from dateutil.tz import tzutc
+from six import text_type
+
+from bson import compile_encoder, dumps, loads
+from bson.types import Int64
+
+
+class TestCompiledEncoder(TestCase):
+    def setUp(self):
+        self.doc = {
+            "id": 12,
+            "big": 2 ** 40,
+            "huge": 2 ** 63,
+            "name": u"caf\N{LATIN SMALL LETTER E WITH ACUTE}",
+            "score": 1.5,
+            "ok": True,
+            "none": None,
+            "raw": b"\x00\x01",
+            "ts": datetime(2020, 1, 2, 3, 4, 5, 6000, tzutc()),
+            "uuid": UUID('584bcd8f-6d81-485a-bac9-629c14b53847'),
+            "wide": Int64(5),
+            "price": Decimal("2.5"),
+            "tags": [u"a", u"b"],
+            "meta": {"x": 1, "y": u"z"},
+        }
+
+    def test_matches_dumps(self):
+        encode = compile_encoder(self.doc)
+        self.assertEqual(encode(self.doc), dumps(self.doc))
+        other = dict(self.doc, id=-3, name=u"", tags=[], meta={"x": 2,
+                                                                 "y": u""})
+        self.assertEqual(encode(other), dumps(other))
+
+    def test_fixed_width(self):
+        doc = {"a": 1, "b": 2.5, "c": False, "d": None}
+        encode = compile_encoder(doc)
+        self.assertEqual(encode(doc), dumps(doc))
+        self.assertEqual(loads(encode(doc)), doc)
+
+    def test_schema(self):
+        encode = compile_encoder({"id": int, "name": text_type, "n": float})
+        doc = {"id": 7, "name": u"x", "n": 0.5}
+        self.assertEqual(encode(doc), dumps(doc))
+
+    def test_fallback(self):
+        encode = compile_encoder({"a": 1, "b": u"x", "c": {"d": 1}})
+        for doc in [{"a": 1, "b": u"x"},
+                    {"b": u"x", "a": 1, "c": {"d": 1}},
+                    {"a": 2 ** 40, "b": u"x", "c": {"d": 1}},
+                    {"a": True, "b": u"x", "c": {"d": 1}},
+                    {"a": 1, "b": b"x", "c": {"d": 1}},
+                    {"a": 1, "b": u"x", "c": {"d": u"1"}},
+                    {"a": 1, "b": u"x", "c": {"d": 1}, "e": 1}]:
+            self.assertEqual(encode(doc), dumps(doc))
+
+    def test_key_types(self):
+        encode = compile_encoder({1: 1})
+        self.assertEqual(encode({True: 1}), dumps({True: 1}))
+        self.assertEqual(encode({1: 1}), dumps({1: 1}))
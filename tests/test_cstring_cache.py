@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+from unittest import TestCase
+
+from bson import dumps, loads, cstring_cache_info, set_cstring_cache_size
+from bson.codec import CSTRING_CACHE_SIZE
+
+
+class TestCStringCache(TestCase):
+    def tearDown(self):
+        set_cstring_cache_size(CSTRING_CACHE_SIZE)
+
+    def test_hits(self):
+        set_cstring_cache_size(16)
+        docs = [{"name": u"x", "size": i} for i in range(10)]
+        for doc in docs:
+            self.assertEqual(loads(dumps(doc)), doc)
+        info = cstring_cache_info()
+        self.assertEqual(info.misses, 2)
+        self.assertEqual(info.hits, 18)
+        self.assertEqual(info.maxsize, 16)
+
+    def test_bounded(self):
+        set_cstring_cache_size(4)
+        dumps(dict(("key%d" % i, i) for i in range(10)))
+        self.assertEqual(cstring_cache_info().currsize, 4)
+
+    def test_nul_in_name(self):
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                dumps({"a\x00b": 1})
+
+    def test_typed_keys(self):
+        self.assertEqual(loads(dumps({1: u"int"})), {u"1": u"int"})
+        self.assertEqual(loads(dumps({1.0: u"float"})), {u"1.0": u"float"})
+        self.assertEqual(loads(dumps({True: u"bool"})), {u"True": u"bool"})
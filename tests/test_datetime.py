@@ -1,5 +1,6 @@
 #!/usr/bin/env python
-from datetime import datetime
+import warnings
+from datetime import datetime, timedelta, timezone
 from unittest import TestCase
 
 from dateutil.tz import tzutc
@@ -17,3 +18,46 @@ class TestDateTime(TestCase):
         seconds_delta = (td.microseconds + (td.seconds + td.days * 24 * 3600) *
                          1e6) / 1e6
         self.assertTrue(abs(seconds_delta) < 0.001)
+
+    def test_millisecond_round_trip(self):
+        value = datetime(2038, 1, 19, 3, 14, 8, 123000, tzinfo=timezone.utc)
+        self.assertEqual(loads(dumps({"t": value}))["t"], value)
+        before_epoch = datetime(1901, 12, 13, 20, 45, 52, 999000,
+                                tzinfo=timezone.utc)
+        self.assertEqual(loads(dumps({"t": before_epoch}))["t"],
+                         before_epoch)
+
+    def test_rounds_to_nearest_millisecond(self):
+        value = datetime(2020, 1, 1, 0, 0, 0, 1600, tzinfo=timezone.utc)
+        self.assertEqual(loads(dumps({"t": value}))["t"].microsecond, 2000)
+
+    def test_other_timezone(self):
+        value = datetime(2020, 1, 1, 12, tzinfo=timezone(timedelta(hours=2)))
+        decoded = loads(dumps({"t": value}))["t"]
+        self.assertEqual(decoded, value)
+        self.assertEqual(decoded.hour, 10)
+
+    def test_datetime_modes(self):
+        value = datetime(2020, 1, 1, 12, 30, 0, 5000, tzinfo=timezone.utc)
+        serialized = dumps({"t": value, "l": [value], "d": {"t": value}})
+
+        aware = loads(serialized, datetime_mode="aware")
+        self.assertIs(aware["t"].tzinfo, timezone.utc)
+
+        naive = loads(serialized, datetime_mode="naive")
+        expected = datetime(2020, 1, 1, 12, 30, 0, 5000)
+        self.assertEqual(naive, {"t": expected, "l": [expected],
+                                 "d": {"t": expected}})
+
+        millis = loads(serialized, datetime_mode="millis")
+        self.assertEqual(millis["t"], 1577881800005)
+        self.assertEqual(millis["l"], [1577881800005])
+        self.assertEqual(millis["d"]["t"], 1577881800005)
+
+        self.assertRaises(ValueError, loads, serialized, datetime_mode="utc")
+
+    def test_naive_encodes_as_utc(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            serialized = dumps({"t": datetime(1970, 1, 1, 0, 0, 1)})
+        self.assertEqual(loads(serialized, datetime_mode="millis")["t"], 1000)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+import struct
+from unittest import TestCase
+
+from bson import dumps, loads, register_decoder
+from bson.codec import UnknownElementType
+
+
+def decode_binary_as_bytearray(data, base):
+    length = struct.unpack_from("<i", data, base)[0]
+    return bytearray(data[base + 5:base + 5 + length]), base + 5 + length
+
+
+def decode_max_key(data, base):
+    return "max", base
+
+
+class TestDecoderRegistry(TestCase):
+    def tearDown(self):
+        register_decoder(0x05, None)
+        register_decoder(0x7F, None)
+
+    def test_override(self):
+        serialized = dumps({"b": b"abc", "l": [b"d"], "s": u"x"})
+        register_decoder(0x05, decode_binary_as_bytearray)
+        decoded = loads(serialized)
+        self.assertEqual(decoded, {"b": bytearray(b"abc"),
+                                   "l": [bytearray(b"d")], "s": u"x"})
+        self.assertIs(type(decoded["b"]), bytearray)
+        self.assertIs(type(loads(memoryview(serialized))["b"]), bytearray)
+
+        register_decoder(0x05, None)
+        self.assertIs(type(loads(serialized)["b"]), bytes)
+
+    def test_new_type(self):
+        serialized = struct.pack("<i", 14) + b"\x7fk\x00\x10a\x00" + \
+            b"\x01\x00\x00\x00\x00"
+        self.assertRaises(UnknownElementType, loads, serialized)
+        register_decoder(0x7F, decode_max_key)
+        self.assertEqual(loads(serialized), {"k": "max", "a": 1})
+
+    def test_unknown_type(self):
+        serialized = b"\x0c\x00\x00\x00\x06undef\x00\x00"
+        with self.assertRaises(UnknownElementType) as context:
+            loads(serialized)
+        self.assertEqual(context.exception.element_type, 0x06)
+        self.assertIn("0x06", str(context.exception))
+        self.assertIn("undef", str(context.exception))
+        self.assertIn("offset 4", str(context.exception))
+
+    def test_invalid_type(self):
+        self.assertRaises(ValueError, register_decoder, 0x100,
+                          decode_max_key)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+import struct
+import sys
+from io import BytesIO
+from unittest import TestCase
+
+from bson import dump, dumps, encoded_size, loads
+from bson.codec import MAX_DEPTH, MaxDepthExceeded, set_max_depth
+
+
+def nested(depth):
+    # Documents and arrays alternate, with a document outermost.
+    value = {"leaf": 1}
+    for i in range(depth - 1, 0, -1):
+        value = {"d": value} if i % 2 else [value]
+    return value
+
+
+def nested_documents(depth):
+    data = b"\x05\x00\x00\x00\x00"
+    for _ in range(depth - 1):
+        data = struct.pack("<i", len(data) + 8) + b"\x03d\x00" + data + \
+            b"\x00"
+    return data
+
+
+class TestDepth(TestCase):
+    def tearDown(self):
+        set_max_depth(MAX_DEPTH)
+
+    def test_deeper_than_recursion_limit(self):
+        depth = sys.getrecursionlimit() + 100
+        set_max_depth(2 * depth)
+        doc = nested(depth)
+        serialized = dumps(doc)
+        self.assertEqual(len(serialized), encoded_size(doc))
+        # Comparing the trees themselves would hit the recursion limit.
+        self.assertEqual(dumps(loads(serialized)), serialized)
+        fp = BytesIO()
+        dump(doc, fp)
+        self.assertEqual(fp.getvalue(), serialized)
+
+    def test_encode_limit(self):
+        set_max_depth(10)
+        dumps(nested(10))
+        self.assertRaises(MaxDepthExceeded, dumps, nested(11))
+        self.assertRaises(MaxDepthExceeded, encoded_size, nested(11))
+
+    def test_cycle(self):
+        doc = {}
+        doc["self"] = doc
+        self.assertRaises(MaxDepthExceeded, dumps, doc)
+
+    def test_decode_limit(self):
+        set_max_depth(10)
+        loads(nested_documents(10))
+        with self.assertRaises(MaxDepthExceeded) as context:
+            loads(nested_documents(11))
+        self.assertEqual(context.exception.max_depth, 10)
+
+    def test_invalid_limit(self):
+        self.assertRaises(ValueError, set_max_depth, 0)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+import mmap
+from unittest import TestCase
+
+from bson import BufferTooSmall, dumps, dumps_into, loads
+
+
+class TestDumpsInto(TestCase):
+    def setUp(self):
+        self.doc = {"id": 1, "nested": {"items": [1, 2, u"three"]}}
+        self.data = dumps(self.doc)
+
+    def test_bytearray(self):
+        buf = bytearray(b"\xff" * 100)
+        written = dumps_into(self.doc, buf, 10)
+        self.assertEqual(written, len(self.data))
+        self.assertEqual(bytes(buf[10:10 + written]), self.data)
+        self.assertEqual(bytes(buf[:10]), b"\xff" * 10)
+        self.assertEqual(bytes(buf[10 + written:]),
+                         b"\xff" * (90 - written))
+        buf.append(0)
+
+    def test_memoryview(self):
+        buf = bytearray(len(self.data) + 4)
+        written = dumps_into(self.doc, memoryview(buf)[4:])
+        self.assertEqual(loads(bytes(buf[4:4 + written])), self.doc)
+
+    def test_mmap(self):
+        buf = mmap.mmap(-1, 4096)
+        try:
+            written = dumps_into(self.doc, buf, 100)
+            self.assertEqual(buf[100:100 + written], self.data)
+        finally:
+            buf.close()
+
+    def test_too_small(self):
+        buf = bytearray(len(self.data) + 2)
+        with self.assertRaises(BufferTooSmall) as cm:
+            dumps_into(self.doc, buf, 3)
+        self.assertEqual(cm.exception.required, len(self.data))
+        self.assertEqual(cm.exception.available, len(self.data) - 1)
+        self.assertEqual(dumps_into(self.doc, buf, 2), len(self.data))
+        with self.assertRaises(ValueError):
+            dumps_into(self.doc, buf, len(buf) + 1)
+
+    def test_too_small_generator(self):
+        def generator(obj, stack):
+            return list(obj)[:1]
+
+        data = dumps(self.doc, generator=generator)
+        with self.assertRaises(BufferTooSmall) as cm:
+            dumps_into(self.doc, bytearray(len(data) - 1), generator=generator)
+        self.assertEqual(cm.exception.required, len(data))
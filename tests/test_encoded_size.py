@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+from datetime import datetime
+from decimal import Decimal
+from unittest import TestCase
+from uuid import UUID
+
+from dateutil.tz import tzutc
+
+from bson import dumps, encoded_size, encode_string, register_encoder
+from bson.types import Int32, Int64, UInt64
+
+
+class Tag(object):
+    def __init__(self, name):
+        self.name = name
+
+
+def encode_tag(ename, value, buf, *args):
+    buf.write(b"\x02" + ename + encode_string(value.name))
+
+
+class TestEncodedSize(TestCase):
+    def tearDown(self):
+        register_encoder(Tag, None)
+
+    def test_types(self):
+        doc = {
+            "int32": 1, "int64": -2 ** 40, "uint64": 2 ** 64 - 1,
+            "wrapped": [Int32(1), Int64(2), UInt64(3)],
+            "float": 0.5, "decimal": Decimal("1.5"), "bool": True,
+            "ascii": u"abc", "utf8": u"\N{SNOWMAN}", "binary": b"\x00\xff",
+            "uuid": UUID('584bcd8f-6d81-485a-bac9-629c14b53847'),
+            "date": datetime(2020, 1, 1, tzinfo=tzutc()), "none": None,
+            u"\N{SNOWMAN}": {"nested": [{"a": [1, 2.0, u"3"]}, (4,)]},
+            "long": list(range(3000)),
+        }
+        self.assertEqual(encoded_size(doc), len(dumps(doc)))
+        self.assertEqual(encoded_size({}), 5)
+
+    def test_on_unknown(self):
+        doc = {"decimal": complex(1, 2)}
+        self.assertEqual(encoded_size(doc, on_unknown=str),
+                         len(dumps(doc, on_unknown=str)))
+
+    def test_registered_encoder(self):
+        register_encoder(Tag, encode_tag)
+        doc = {"tag": Tag(u"abc"), "tags": [Tag(u"de")]}
+        self.assertEqual(encoded_size(doc), len(dumps(doc)))
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+from collections import OrderedDict
+from enum import IntEnum
+from unittest import TestCase
+
+from bson import dumps, encoded_size, loads, encode_string, \
+    register_encoder, UnknownSerializerError
+
+
+class Point(object):
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+class Point3D(Point):
+    pass
+
+
+def encode_point(ename, value, buf, *args):
+    buf.write(b"\x02" + ename + encode_string(u"%d,%d" % (value.x, value.y)))
+
+
+class Color(IntEnum):
+    RED = 1
+
+
+class TestEncoderRegistry(TestCase):
+    def tearDown(self):
+        register_encoder(Point, None)
+        register_encoder(float, None)
+    def test_subclasses(self):
+        doc = OrderedDict([("color", Color.RED), ("flag", True)])
+        self.assertEqual(loads(dumps(doc)), {"color": 1, "flag": True})
+
+    def test_register_encoder(self):
+        register_encoder(Point, encode_point)
+        doc = {"p": Point(1, 2), "q": [Point3D(3, 4)]}
+        self.assertEqual(loads(dumps(doc)), {"p": u"1,2", "q": [u"3,4"]})
+
+    def test_unregister_encoder(self):
+        register_encoder(Point, encode_point)
+        register_encoder(Point, None)
+        with self.assertRaises(UnknownSerializerError):
+            dumps({"p": Point(1, 2)})
+        register_encoder(Point, None)
+
+    def test_restore_builtin(self):
+        register_encoder(float, encode_point)
+        register_encoder(float, None)
+        self.assertEqual(loads(dumps({"f": 0.5})), {"f": 0.5})
+        self.assertEqual(encoded_size({"f": 0.5}), len(dumps({"f": 0.5})))
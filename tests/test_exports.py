@@ -0,0 +1,16 @@
+#!/usr/bin/env python
+from unittest import TestCase
+
+import bson
+
+
+class TestExports(TestCase):
+    def test_star_import(self):
+        namespace = {}
+        exec("from bson import *", namespace)
+        for name in bson.__all__:
+            self.assertIs(namespace[name], getattr(bson, name))
+        for name in ("encoded_size", "register_encoder", "register_decoder",
+                     "RawBSONDocument", "LazyBSONDocument", "BufferTooSmall",
+                     "InvalidBSON"):
+            self.assertIn(name, namespace)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+import bz2
+import gzip
+import lzma
+import os
+import tempfile
+from io import BytesIO
+from unittest import TestCase
+
+from bson import dump, dumps, load
+
+
+class Unseekable(object):
+    def __init__(self):
+        self.buf = BytesIO()
+
+    def write(self, data):
+        return self.buf.write(data)
+
+
+class TestFile(TestCase):
+    def setUp(self):
+        self.docs = [{"id": i, "nested": {"items": list(range(i))}}
+                     for i in range(10)]
+
+    def test_seekable(self):
+        fp = BytesIO()
+        fp.write(b"prefix")
+        for doc in self.docs:
+            dump(doc, fp)
+        self.assertEqual(fp.getvalue(), b"prefix" +
+                         b"".join(dumps(doc) for doc in self.docs))
+        fp.seek(6)
+        self.assertEqual([load(fp) for _ in self.docs], self.docs)
+        self.assertIsNone(load(fp))
+
+    def test_unseekable(self):
+        fp = Unseekable()
+        for doc in self.docs:
+            dump(doc, fp)
+        self.assertEqual(fp.buf.getvalue(),
+                         b"".join(dumps(doc) for doc in self.docs))
+
+    def test_unseekable_generator(self):
+        # Leaves out "id" and reverses the order of the other keys.
+        def generator(obj, stack):
+            return sorted((key for key in obj if key != "id"), reverse=True)
+
+        fp = Unseekable()
+        for doc in self.docs:
+            dump(doc, fp, generator=generator)
+        self.assertEqual(fp.buf.getvalue(),
+                         b"".join(dumps(doc, generator=generator)
+                                  for doc in self.docs))
+
+    def test_append_mode(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            for doc in self.docs:
+                with open(path, "ab") as fp:
+                    dump(doc, fp)
+            with open(path, "rb") as fp:
+                self.assertEqual([load(fp) for _ in self.docs], self.docs)
+                self.assertIsNone(load(fp))
+        finally:
+            os.remove(path)
+
+    def test_compressed(self):
+        # These report seekable() but cannot seek backwards when writing.
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            for module in (gzip, bz2, lzma):
+                with module.open(path, "wb") as fp:
+                    for doc in self.docs:
+                        dump(doc, fp)
+                with module.open(path, "rb") as fp:
+                    self.assertEqual([load(fp) for _ in self.docs],
+                                     self.docs)
+                    self.assertIsNone(load(fp))
+        finally:
+            os.remove(path)
+
+    def test_truncated(self):
+        with self.assertRaises(ValueError):
+            load(BytesIO(dumps(self.docs[3])[:-1]))
+        with self.assertRaises(ValueError):
+            load(BytesIO(b"\x05\x00"))
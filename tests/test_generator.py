@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+from unittest import TestCase
+
+from bson import dumps, loads
+
+
+class TestGenerator(TestCase):
+    def test_key_order(self):
+        paths = []
+
+        def generator(obj, traversal_stack):
+            paths.append([step.key for step in traversal_stack])
+            return sorted(obj, reverse=True)
+
+        doc = {"a": 1, "b": {"x": 1, "y": [{"z": 1}]}}
+        serialized = dumps(doc, generator=generator)
+        self.assertEqual(serialized, dumps(
+            {"b": {"y": [{"z": 1}], "x": 1}, "a": 1}))
+        self.assertEqual(loads(serialized), doc)
+        self.assertEqual(paths, [[], ["b"], ["b", "y", 0]])
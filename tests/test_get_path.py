@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+import mmap
+from datetime import datetime, timezone
+from unittest import TestCase
+
+from bson import MISSING, dumps, get_path
+from bson.objectid import ObjectId
+
+
+class TestGetPath(TestCase):
+    def setUp(self):
+        self.oid = ObjectId(b"foo-bar-quux")
+        self.when = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        self.doc = {
+            "shard": {"key": self.oid, "region": u"eu"},
+            "a": {"b": [{"c": 1}, {"c": 2, u"é": u"x"}], "blob": b"\x00\x01"},
+            "when": self.when,
+            "n": 5,
+        }
+        self.data = dumps(self.doc)
+
+    def test_values(self):
+        self.assertEqual(get_path(self.data, "n"), 5)
+        self.assertEqual(get_path(self.data, "shard.key"), self.oid)
+        self.assertEqual(get_path(self.data, "a.b.1.c"), 2)
+        self.assertEqual(get_path(self.data, u"a.b.1.é"), u"x")
+        self.assertEqual(get_path(self.data, "a.blob"), b"\x00\x01")
+        self.assertEqual(get_path(self.data, "when"), self.when)
+
+    def test_containers(self):
+        self.assertEqual(get_path(self.data, "shard"), self.doc["shard"])
+        self.assertEqual(get_path(self.data, "a.b"), self.doc["a"]["b"])
+        self.assertEqual(get_path(self.data, "a.b.0"), {"c": 1})
+
+    def test_missing(self):
+        for path in ("x", "shard.x", "a.b.2", "a.b.0.c.d", "n.x", "a.b.01",
+                     "shard.keyx", "shard.ke"):
+            self.assertIs(get_path(self.data, path), MISSING, path)
+        self.assertIsNone(get_path(self.data, "x", None))
+
+    def test_options(self):
+        self.assertEqual(get_path(self.data, "when", datetime_mode="millis"),
+                         1577836800000)
+        self.assertEqual(get_path(self.data, "shard.key",
+                                  hex_object_ids=True),
+                         b"666f6f2d6261722d71757578")
+
+    def test_buffers(self):
+        self.assertEqual(get_path(memoryview(self.data), "a.b.1.c"), 2)
+        self.assertEqual(get_path(bytearray(self.data), "a.b.1.c"), 2)
+        data = mmap.mmap(-1, len(self.data))
+        try:
+            data.write(self.data)
+            self.assertEqual(get_path(data, "shard.region"), u"eu")
+            self.assertIs(get_path(data, "shard.x"), MISSING)
+        finally:
+            data.close()
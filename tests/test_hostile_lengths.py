@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+import struct
+from unittest import TestCase
+
+from bson import get_path, loads, loads_columns, loads_many
+
+
+def document(body):
+    return struct.pack("<i", len(body) + 5) + body + b"\x00"
+
+
+def element(type_byte, name, length, rest=b""):
+    return type_byte + name + b"\x00" + struct.pack("<i", length) + rest
+
+
+class TestHostileLengths(TestCase):
+    # Each of these lengths would send a decoder backwards, or in place,
+    # and used to make it loop forever.
+    def cases(self):
+        # A document whose length points back to its own start.
+        yield document(element(b"\x03", b"d", 0, b"\x00" * 4))
+        yield document(element(b"\x03", b"d", -7, b"\x00" * 4))
+        yield document(element(b"\x04", b"a", 4, b"\x00" * 4))
+        yield document(element(b"\x02", b"s", -10, b"\x00" * 4))
+        yield document(element(b"\x02", b"s", 0, b"\x00" * 4))
+        yield document(element(b"\x05", b"b", -16, b"\x00" * 4))
+
+    def test_loads(self):
+        for data in self.cases():
+            with self.assertRaises(ValueError):
+                loads(data)
+            with self.assertRaises(ValueError):
+                loads(data, fields=[u"x"])
+            with self.assertRaises(ValueError):
+                get_path(data, u"x")
+            with self.assertRaises(ValueError):
+                loads_columns(data)
+            with self.assertRaises(ValueError):
+                dict(loads(data, lazy=True))
+
+    def test_overrun(self):
+        # A nested document running past the one enclosing it.
+        data = document(element(b"\x03", b"d", 64, b"\x00" * 4)) + \
+            b"\x00" * 64
+        with self.assertRaises(ValueError):
+            loads(data[:-64])
+        with self.assertRaises(ValueError):
+            loads_many(data)
+        with self.assertRaises(ValueError):
+            loads(data[:-64], lazy=True)[u"d"]
+
+    def test_string_overrun_into_next_document(self):
+        # A string running past its document into the one after it, which
+        # used to make loads_columns rebuild the same layout forever.
+        first = document(element(b"\x02", b"s", 16, b"abc\x00"))
+        second = document(element(b"\x02", b"s", 4, b"abc\x00"))
+        with self.assertRaises(ValueError):
+            loads_columns(first + second + second)
+        with self.assertRaises(ValueError):
+            loads_columns(second + first + second)
+
+    def test_empty_documents(self):
+        with self.assertRaises(ValueError):
+            loads_many(b"\x00\x00\x00\x00\x00")
+        with self.assertRaises(ValueError):
+            loads(b"\x04\x00\x00\x00\x00")
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+from io import BytesIO
+from unittest import TestCase
+
+from bson import dumps, dumps_many, load, loads, loads_many, \
+    name_cache_info, set_name_cache_size
+from bson.codec import NAME_CACHE_SIZE
+
+
+class TestInternKeys(TestCase):
+    def setUp(self):
+        set_name_cache_size(16)
+
+    def tearDown(self):
+        set_name_cache_size(NAME_CACHE_SIZE)
+
+    def test_shared_keys(self):
+        docs = [{u"name": u"x", u"size": i} for i in range(10)]
+        decoded = loads_many(dumps_many(docs, concatenate=True),
+                             intern_keys=True)
+        self.assertEqual(decoded, docs)
+        first = list(decoded[0])
+        for doc in decoded[1:]:
+            for key, other in zip(doc, first):
+                self.assertIs(key, other)
+        info = name_cache_info()
+        self.assertEqual(info.misses, 2)
+        self.assertEqual(info.hits, 18)
+
+    def test_not_interned_by_default(self):
+        loads(dumps({u"a": 1}))
+        self.assertEqual(name_cache_info().currsize, 0)
+
+    def test_buffers(self):
+        doc = {u"a": {u"b": [{u"c": 1}]}, u"caf\xe9": 2}
+        data = dumps(doc)
+        for buf in (data, bytearray(data), memoryview(data)):
+            self.assertEqual(loads(buf, intern_keys=True), doc)
+        self.assertEqual(load(BytesIO(data), intern_keys=True), doc)
+
+    def test_non_utf8_name(self):
+        data = b"\x09\x00\x00\x00\x0a\xff\xfe\x00\x00"
+        self.assertEqual(loads(data, intern_keys=True), {b"\xff\xfe": None})
+
+    def test_bounded(self):
+        set_name_cache_size(4)
+        loads(dumps(dict((u"key%d" % i, i) for i in range(10))),
+              intern_keys=True)
+        self.assertEqual(name_cache_info().currsize, 4)
+
+    def test_projection(self):
+        data = dumps({u"a": 1, u"b": {u"c": 2, u"d": 3}})
+        self.assertEqual(loads(data, fields=[u"b.c"], intern_keys=True),
+                         {u"b": {u"c": 2}})
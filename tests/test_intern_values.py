@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+from unittest import TestCase
+
+from bson import dumps, dumps_many, loads, loads_many, register_decoder, \
+    set_value_cache_size, value_cache_info
+from bson.codec import VALUE_CACHE_SIZE
+
+
+class TestInternValues(TestCase):
+    def setUp(self):
+        set_value_cache_size(16, max_value_size=8)
+
+    def tearDown(self):
+        set_value_cache_size(VALUE_CACHE_SIZE)
+
+    def decode(self, docs, intern_values):
+        data = dumps_many(docs, concatenate=True)
+        decoded = loads_many(data, intern_values=intern_values)
+        self.assertEqual(decoded, docs)
+        return decoded
+
+    def test_shared_values(self):
+        docs = [{u"status": u"ok", u"region": u"eu"} for _ in range(10)]
+        decoded = self.decode(docs, True)
+        for doc in decoded[1:]:
+            self.assertIs(doc[u"status"], decoded[0][u"status"])
+            self.assertIs(doc[u"region"], decoded[0][u"region"])
+        info = value_cache_info()
+        self.assertEqual(info.misses, 2)
+        self.assertEqual(info.hits, 18)
+
+    def test_fields(self):
+        docs = [{u"status": u"ok", u"tags": [u"a"], u"n": {u"status": u"x"},
+                 u"other": u"y"} for _ in range(3)]
+        self.decode(docs, {u"status"})
+        self.assertEqual(value_cache_info().currsize, 2)
+
+    def test_arrays(self):
+        self.decode([{u"tags": [u"a", u"b", u"a"]}], True)
+        info = value_cache_info()
+        self.assertEqual((info.hits, info.misses), (1, 2))
+
+    def test_long_values(self):
+        self.decode([{u"s": u"x" * 9}, {u"s": u"x" * 8}], True)
+        self.assertEqual(value_cache_info().currsize, 1)
+
+    def test_default(self):
+        self.assertEqual(loads(dumps({u"s": u"caf\xe9"})), {u"s": u"caf\xe9"})
+        self.assertEqual(value_cache_info().currsize, 0)
+
+    def test_buffers(self):
+        data = dumps({u"s": u"caf\xe9"})
+        for buf in (bytearray(data), memoryview(data)):
+            self.assertEqual(loads(buf, intern_values=True),
+                             {u"s": u"caf\xe9"})
+
+    def test_registered_decoder(self):
+        register_decoder(0x02, lambda data, base: (u"decoded", base + 6))
+        try:
+            self.assertEqual(loads(dumps({u"s": u"a"}), intern_values=True),
+                             {u"s": u"decoded"})
+        finally:
+            register_decoder(0x02, None)
+        self.assertEqual(value_cache_info().currsize, 0)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+import struct
+from datetime import datetime, timezone
+from unittest import TestCase
+
+from bson import (LazyBSONArray, LazyBSONDocument, dumps, encoded_size,
+                  loads, register_decoder)
+from bson.codec import UnknownElementType
+
+
+class TestLazyBSONDocument(TestCase):
+    def setUp(self):
+        self.when = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        self.inner = {"b": [1, {"c": u"d"}, [2.5]], "when": self.when}
+        self.doc = {"a": 1, "inner": self.inner, "s": u"x", "bin": b"\x00"}
+        self.data = dumps(self.doc)
+
+    def test_loads_lazy(self):
+        doc = loads(self.data, lazy=True)
+        self.assertIsInstance(doc, LazyBSONDocument)
+        self.assertEqual(doc, self.doc)
+        self.assertEqual(list(doc), ["a", "inner", "s", "bin"])
+        self.assertEqual(len(doc), 4)
+        self.assertIn("s", doc)
+        self.assertNotIn("t", doc)
+        self.assertRaises(KeyError, doc.__getitem__, "t")
+        self.assertIsNone(doc.get("t"))
+
+    def test_nested(self):
+        doc = loads(self.data, lazy=True)
+        inner = doc["inner"]
+        self.assertIsInstance(inner, LazyBSONDocument)
+        self.assertIs(doc["inner"], inner)
+        array = inner["b"]
+        self.assertIsInstance(array, LazyBSONArray)
+        self.assertIsInstance(array[1], LazyBSONDocument)
+        self.assertEqual(array, [1, {"c": u"d"}, [2.5]])
+        self.assertEqual(array[-1], [2.5])
+        self.assertRaises(IndexError, array.__getitem__, -4)
+        self.assertEqual(array[:2], [1, {"c": u"d"}])
+        self.assertEqual(len(array), 3)
+        self.assertRaises(IndexError, array.__getitem__, 3)
+        self.assertNotEqual(array, [1])
+        self.assertEqual(bytes(inner.raw), dumps(self.inner))
+
+    def test_values_decoded_on_access(self):
+        calls = []
+
+        def decode_binary(data, base):
+            calls.append(base)
+            length = struct.unpack_from("<i", data, base)[0]
+            return bytes(data[base + 5:base + 5 + length]), base + 5 + length
+
+        register_decoder(0x05, decode_binary)
+        try:
+            doc = loads(self.data, lazy=True)
+            self.assertEqual(doc["a"], 1)
+            self.assertEqual(calls, [])
+            self.assertEqual(doc["bin"], b"\x00")
+            self.assertEqual(doc["bin"], b"\x00")
+            self.assertEqual(len(calls), 1)
+        finally:
+            register_decoder(0x05, None)
+
+    def test_scans_only_as_far_as_needed(self):
+        doc = loads(self.data, lazy=True)
+        self.assertEqual(doc["inner"]["when"], self.when)
+        self.assertEqual(doc["a"], 1)
+        self.assertIsNotNone(doc._next)
+        self.assertNotIn("missing", doc)
+        self.assertIsNone(doc._next)
+        self.assertEqual(doc["bin"], b"\x00")
+
+    def test_passthrough(self):
+        doc = loads(self.data, lazy=True)
+        self.assertEqual(dumps(doc), self.data)
+        wrapped = {"d": doc["inner"], "l": doc["inner"]["b"]}
+        serialized = dumps(wrapped)
+        self.assertEqual(serialized, dumps({"d": self.inner,
+                                            "l": self.inner["b"]}))
+        self.assertEqual(encoded_size(wrapped), len(serialized))
+
+    def test_buffers(self):
+        self.assertEqual(loads(memoryview(self.data), lazy=True), self.doc)
+        self.assertEqual(loads(bytearray(self.data), lazy=True), self.doc)
+
+    def test_options(self):
+        doc = loads(self.data, lazy=True, datetime_mode="millis")
+        self.assertEqual(doc["inner"]["when"], 1577836800000)
+        self.assertRaises(ValueError, loads, self.data, lazy=True,
+                          datetime_mode="utc")
+
+    def test_unknown_type(self):
+        data = struct.pack("<i", 15) + b"\x10a\x00\x01\x00\x00\x00" + \
+            b"\x06b\x00\x00"
+        doc = loads(data, lazy=True)
+        self.assertEqual(doc["a"], 1)
+        self.assertRaises(UnknownElementType, doc.__getitem__, "b")
+        self.assertRaises(UnknownElementType, len, doc)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, loads, self.data[:-1], lazy=True)
@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+from unittest import TestCase
+
+from bson import dumps, dumps_many, loads_many
+
+
+class TestMany(TestCase):
+    def setUp(self):
+        self.docs = [{"id": i, "name": u"doc%d" % i, "tags": [i, {"n": i}]}
+                     for i in range(100)]
+
+    def test_dumps_many(self):
+        self.assertEqual(dumps_many(self.docs),
+                         [dumps(doc) for doc in self.docs])
+        self.assertEqual(dumps_many(iter(self.docs), concatenate=True),
+                         b"".join(dumps(doc) for doc in self.docs))
+        self.assertEqual(dumps_many([]), [])
+        self.assertEqual(dumps_many([], concatenate=True), b"")
+
+    def test_loads_many(self):
+        data = dumps_many(self.docs, concatenate=True)
+        self.assertEqual(loads_many(data), self.docs)
+        self.assertEqual(loads_many(b""), [])
@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+from struct import unpack
+from unittest import TestCase
+
+from bson import dumps, loads
+
+
+class TestNested(TestCase):
+    def test_nested_lengths(self):
+        serialized = dumps({"a": {"b": [1]}})
+        self.assertEqual(serialized,
+                         b'\x1c\x00\x00\x00\x03a\x00\x14\x00\x00\x00\x04b\x00'
+                         b'\x0c\x00\x00\x00\x100\x00\x01\x00\x00\x00\x00\x00'
+                         b'\x00')
+
+    def test_deep_nesting(self):
+        doc = {"leaf": u"value"}
+        for i in range(100):
+            doc = {"level%d" % i: doc, "items": [i, [i]]}
+        serialized = dumps(doc)
+        self.assertEqual(len(serialized), unpack("<i", serialized[:4])[0])
+        self.assertEqual(loads(serialized), doc)
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+from unittest import TestCase
+from unittest.mock import patch
+
+from bson import compile_encoder, dumps, loads
+from bson.codec import encode_object_id_element, encoded_size
+from bson.objectid import ObjectId
+
+
+class TestObjectIdElement(TestCase):
+    def setUp(self):
+        self.oid = ObjectId(b"foo-bar-quux")
+        self.serialized = b"\x16\x00\x00\x00\x07_id\x00foo-bar-quux\x00"
+
+    def test_encode(self):
+        self.assertEqual(dumps({"_id": self.oid}), self.serialized)
+        self.assertEqual(encoded_size({"_id": self.oid}), len(self.serialized))
+        self.assertEqual(encode_object_id_element("_id", self.oid),
+                         self.serialized[4:-1])
+
+    def test_subclass(self):
+        class MyObjectId(ObjectId):
+            __slots__ = ()
+        self.assertEqual(dumps({"_id": MyObjectId(self.oid)}),
+                         self.serialized)
+
+    def test_decode(self):
+        decoded = loads(self.serialized)["_id"]
+        self.assertIs(type(decoded), ObjectId)
+        self.assertEqual(decoded, self.oid)
+        self.assertEqual(loads(dumps({"l": [self.oid], "d": {"i": self.oid}})),
+                         {"l": [self.oid], "d": {"i": self.oid}})
+
+    def test_decode_skips_validation(self):
+        with patch.object(ObjectId, "__init__") as init:
+            decoded = loads(self.serialized)["_id"]
+        init.assert_not_called()
+        self.assertEqual(decoded.binary, b"foo-bar-quux")
+        self.assertEqual(hash(decoded), hash(self.oid))
+        self.assertEqual(str(decoded), str(self.oid))
+
+    def test_decode_hex(self):
+        self.assertEqual(loads(self.serialized, hex_object_ids=True),
+                         {"_id": b"666f6f2d6261722d71757578"})
+        nested = dumps({"l": [self.oid]})
+        self.assertEqual(loads(nested, hex_object_ids=True),
+                         {"l": [b"666f6f2d6261722d71757578"]})
+
+    def test_round_trip(self):
+        doc = {"_id": ObjectId(), "n": 1}
+        self.assertEqual(loads(dumps(doc)), doc)
+        self.assertEqual(compile_encoder(doc)(doc), dumps(doc))
+        self.assertEqual(compile_encoder({"_id": ObjectId, "n": int})(doc),
+                         dumps(doc))
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+import struct
+from array import array
+from unittest import TestCase
+
+from bson import dumps, dumps_into, encoded_size, loads, loads_many, \
+    register_decoder
+from bson.codec import MaxDepthExceeded, MAX_DEPTH, set_max_depth
+
+
+class TestPackedArrays(TestCase):
+    def assertEncodesAsList(self, value):
+        doc = {u"a": value}
+        data = dumps(doc)
+        self.assertEqual(data, dumps({u"a": value.tolist()}))
+        self.assertEqual(encoded_size(doc), len(data))
+        buf = bytearray(len(data))
+        self.assertEqual(dumps_into(doc, buf), len(data))
+        self.assertEqual(buf, data)
+        return data
+
+    def test_encode(self):
+        for value in (array("d", [0.5, -2.0]), array("f", [1.5]),
+                      array("b", [-1, 2]), array("B", b"ab"),
+                      array("H", [65535]), array("i", [1, -2]),
+                      array("I", [2 ** 32 - 1]), array("q", [2 ** 40, -1]),
+                      array("q", [2 ** 40, -2 ** 40]), array("q", [1, 2]),
+                      array("Q", [2 ** 64 - 1]), array("d"),
+                      array("d", range(2000))):
+            self.assertEncodesAsList(value)
+
+    def test_decode(self):
+        doc = {u"i": [1, -2], u"q": [2 ** 40, -2 ** 40], u"m": [1, 2 ** 40],
+               u"d": [0.5, 1.0], u"s": [u"x"], u"e": [], u"x": [1, 0.5],
+               u"n": [{u"a": [1]}, [2.0]], u"l": list(range(1500))}
+        decoded = loads(dumps(doc), packed_arrays=True)
+        self.assertEqual(decoded, {
+            u"i": array("i", [1, -2]),
+            u"q": array("q", [2 ** 40, -2 ** 40]),
+            u"m": array("q", [1, 2 ** 40]),
+            u"d": array("d", [0.5, 1.0]),
+            u"s": [u"x"], u"e": [], u"x": [1, 0.5],
+            u"n": [{u"a": array("i", [1])}, array("d", [2.0])],
+            u"l": array("i", range(1500)),
+        })
+        # array.arrays compare equal regardless of their typecodes.
+        typecodes = {u"i": "i", u"q": "q", u"m": "q", u"d": "d", u"l": "i"}
+        for key, typecode in typecodes.items():
+            self.assertEqual(decoded[key].typecode, typecode)
+        self.assertEqual(decoded[u"n"][0][u"a"].typecode, "i")
+        self.assertEqual(loads(dumps(doc)), doc)
+        for buf in (bytearray(dumps(doc)), memoryview(dumps(doc))):
+            self.assertEqual(loads(buf, packed_arrays=True), decoded)
+        self.assertEqual(loads_many(dumps(doc) * 2, packed_arrays=True),
+                         [decoded] * 2)
+
+    def test_round_trip(self):
+        # Lengths around the ends of the runs of same-length keys.
+        for length in (1, 9, 10, 11, 99, 100, 101, 1000, 12345):
+            for value in (array("d", [i / 3.0 for i in range(length)]),
+                          array("i", range(-length, 0)),
+                          array("q", [2 ** 40 + i for i in range(length)])):
+                decoded = loads(dumps({u"a": value}), packed_arrays=True)
+                self.assertEqual(decoded, {u"a": value})
+                self.assertEqual(decoded[u"a"].typecode, value.typecode)
+
+    def test_odd_keys(self):
+        def data(*elements):
+            body = b"".join(elements)
+            inner = struct.pack("<i", len(body) + 5) + body + b"\x00"
+            body = b"\x04a\x00" + inner
+            return struct.pack("<i", len(body) + 5) + body + b"\x00"
+
+        ints = loads(data(b"\x10x\x00" + struct.pack("<i", 7),
+                          b"\x10y\x00" + struct.pack("<i", 8)),
+                     packed_arrays=True)[u"a"]
+        self.assertEqual(ints, array("i", [7, 8]))
+        self.assertEqual(ints.typecode, "i")
+        mixed = loads(data(b"\x10x\x00" + struct.pack("<i", 7),
+                           b"\x12y\x00" + struct.pack("<q", 2 ** 40)),
+                      packed_arrays=True)[u"a"]
+        self.assertEqual(mixed, array("q", [7, 2 ** 40]))
+        self.assertEqual(mixed.typecode, "q")
+        # Same length as a canonical array, with the keys swapped.
+        swapped = loads(data(b"\x011\x00" + struct.pack("<d", 1.0),
+                             b"\x010\x00" + struct.pack("<d", 2.0)),
+                        packed_arrays=True)[u"a"]
+        self.assertEqual(swapped, array("d", [1.0, 2.0]))
+
+    def test_registered_decoder(self):
+        register_decoder(0x10, lambda data, base: (u"int", base + 4))
+        try:
+            self.assertEqual(loads(dumps({u"a": [1]}), packed_arrays=True),
+                             {u"a": [u"int"]})
+        finally:
+            register_decoder(0x10, None)
+
+    def test_projection(self):
+        data = dumps({u"a": [1, 2], u"b": [{u"c": 1}, 3]})
+        self.assertEqual(loads(data, fields=[u"a", u"b.c"],
+                               packed_arrays=True),
+                         {u"a": array("i", [1, 2]), u"b": [{u"c": 1}]})
+
+    def test_depth(self):
+        data = dumps({u"a": [1]})
+        set_max_depth(1)
+        try:
+            with self.assertRaises(MaxDepthExceeded):
+                loads(data, packed_arrays=True)
+        finally:
+            set_max_depth(MAX_DEPTH)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+from unittest import TestCase
+
+from bson import dumps, loads, loads_many, register_decoder
+from bson.codec import projection_tree
+
+
+class TestProjection(TestCase):
+    def setUp(self):
+        self.doc = {
+            "id": 1,
+            "name": u"x",
+            "user": {"name": u"y", "age": 3, "tags": [u"a", u"b"]},
+            "events": [{"kind": u"click", "at": 1}, 2, [{"kind": u"view"}]],
+            "blob": b"\x00" * 100,
+        }
+        self.data = dumps(self.doc)
+
+    def test_top_level(self):
+        self.assertEqual(loads(self.data, fields={"id", "blob"}),
+                         {"id": 1, "blob": self.doc["blob"]})
+        self.assertEqual(loads(self.data, fields=["user"]),
+                         {"user": self.doc["user"]})
+        self.assertEqual(loads(self.data, fields="name"), {"name": u"x"})
+        self.assertEqual(loads(self.data, fields=()), {})
+        self.assertEqual(loads(self.data, fields={"missing"}), {})
+
+    def test_dotted(self):
+        self.assertEqual(loads(self.data, fields={"user.name", "id"}),
+                         {"id": 1, "user": {"name": u"y"}})
+        self.assertEqual(loads(self.data, fields={"user.missing"}),
+                         {"user": {}})
+        self.assertEqual(loads(self.data, fields={"id.x"}), {})
+
+    def test_whole_value_wins(self):
+        expected = {"user": self.doc["user"]}
+        self.assertEqual(loads(self.data, fields=["user.name", "user"]),
+                         expected)
+        self.assertEqual(loads(self.data, fields=["user", "user.name"]),
+                         expected)
+
+    def test_arrays(self):
+        self.assertEqual(loads(self.data, fields={"events.kind"}),
+                         {"events": [{"kind": u"click"}, [{"kind": u"view"}]]})
+        self.assertEqual(loads(self.data, fields={"user.tags"}),
+                         {"user": {"tags": [u"a", u"b"]}})
+
+    def test_skipped_values_not_decoded(self):
+        def fail(data, base):
+            raise AssertionError("decoded a skipped value")
+
+        register_decoder(0x05, fail)
+        try:
+            self.assertEqual(loads(self.data, fields={"user.age"}),
+                             {"user": {"age": 3}})
+        finally:
+            register_decoder(0x05, None)
+
+    def test_loads_many(self):
+        data = self.data + dumps({"id": 2, "other": 1})
+        self.assertEqual(loads_many(data, fields={"id"}),
+                         [{"id": 1}, {"id": 2}])
+
+    def test_projection_tree(self):
+        self.assertEqual(projection_tree(["a.b.c", "a.d", u"é"]),
+                         {b"a": {b"b": {b"c": True}, b"d": True},
+                          u"é".encode("utf-8"): True})
+
+    def test_not_with_lazy(self):
+        self.assertRaises(ValueError, loads, self.data, lazy=True,
+                          fields={"id"})
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+from io import BytesIO
+from unittest import TestCase
+
+from bson import RawBSONDocument, dump, dumps, encoded_size, loads
+
+
+class TestRawBSONDocument(TestCase):
+    def setUp(self):
+        self.inner = {"b": [1, {"c": u"d"}], "e": 2.5}
+        self.data = dumps({"a": 1, "inner": self.inner})
+
+    def test_loads_raw(self):
+        doc = loads(self.data, raw=True)
+        self.assertIsInstance(doc, RawBSONDocument)
+        self.assertEqual(doc.raw, self.data)
+        self.assertEqual(doc, {"a": 1, "inner": self.inner})
+        self.assertIsInstance(doc["inner"], RawBSONDocument)
+        self.assertIsInstance(doc["inner"]["b"][1], RawBSONDocument)
+        self.assertEqual(doc["inner"].raw, dumps(self.inner))
+
+    def test_passthrough(self):
+        inner = loads(self.data, raw=True)["inner"]
+        doc = {"x": inner, "y": [inner]}
+        serialized = dumps(doc)
+        self.assertEqual(serialized, dumps({"x": self.inner,
+                                            "y": [self.inner]}))
+        self.assertEqual(encoded_size(doc), len(serialized))
+        self.assertEqual(dumps(inner), dumps(self.inner))
+        fp = BytesIO()
+        dump(inner, fp)
+        self.assertEqual(fp.getvalue(), dumps(self.inner))
+
+    def test_memoryview(self):
+        doc = RawBSONDocument(memoryview(self.data))
+        self.assertEqual(dumps({"doc": doc}), dumps({"doc": loads(self.data)}))
+        self.assertEqual(doc["inner"]["e"], 2.5)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            RawBSONDocument(self.data[:-1])
+        with self.assertRaises(ValueError):
+            RawBSONDocument(b"")
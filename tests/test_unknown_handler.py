@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
-from bson import dumps, loads
+from bson import dumps, encoded_size, loads
+from bson.codec import UnknownSerializerError
 from decimal import Decimal
 from unittest import TestCase
 
@@ -14,3 +15,16 @@ class TestUnknownHandler(TestCase):
         unserialized = loads(serialized)
         self.assertEqual(float(d), unserialized["decimal"])
 
+
+    def test_unencodable_replacement(self):
+        class Unknown(object):
+            pass
+
+        obj = {"a": Unknown()}
+        identity = lambda value: value
+        with self.assertRaises(UnknownSerializerError):
+            dumps(obj, on_unknown=identity)
+        with self.assertRaises(UnknownSerializerError):
+            encoded_size(obj, on_unknown=identity)
+        with self.assertRaises(UnknownSerializerError):
+            dumps({"a": [Unknown()]}, on_unknown=lambda value: Unknown())
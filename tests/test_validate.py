@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+import random
+import struct
+from datetime import datetime, timezone
+from unittest import TestCase
+from uuid import UUID
+
+from bson import dumps, loads, validate
+from bson.codec import InvalidBSON, MAX_DEPTH, set_max_depth
+from bson.objectid import ObjectId
+
+
+DOC = {
+    "s": u"café",
+    "i": 1,
+    "l": 2 ** 40,
+    "u": 2 ** 63,
+    "f": 0.5,
+    "t": True,
+    "n": None,
+    "b": b"\x00\x01",
+    "uuid": UUID("584bcd8f-6d81-485a-bac9-629c14b53847"),
+    "oid": ObjectId(b"foo-bar-quux"),
+    "when": datetime(2020, 1, 1, tzinfo=timezone.utc),
+    "a": [1, {"x": [u"y"]}],
+}
+
+
+def document(body):
+    return struct.pack("<i", len(body) + 5) + body + b"\x00"
+
+
+class TestValidate(TestCase):
+    def setUp(self):
+        self.data = dumps(DOC)
+
+    def tearDown(self):
+        set_max_depth(MAX_DEPTH)
+
+    def assertInvalid(self, data, offset=None):
+        self.assertFalse(validate(data))
+        with self.assertRaises(InvalidBSON) as context:
+            validate(data, raise_error=True)
+        if offset is not None:
+            self.assertEqual(context.exception.offset, offset)
+        return context.exception
+
+    def test_valid(self):
+        self.assertTrue(validate(self.data))
+        self.assertTrue(validate(self.data, raise_error=True))
+        self.assertTrue(validate(memoryview(self.data)))
+        self.assertTrue(validate(bytearray(self.data)))
+        self.assertTrue(validate(dumps({})))
+
+    def test_lengths(self):
+        self.assertInvalid(b"", 0)
+        self.assertInvalid(self.data[:-1], 0)
+        self.assertInvalid(self.data + b"\x00", 0)
+        self.assertInvalid(self.data[:-1] + b"\x01", len(self.data) - 1)
+        self.assertInvalid(document(b"\x02s\x00\x05\x00\x00\x00ab\x00"), 7)
+        self.assertInvalid(document(b"\x02s\x00\x00\x00\x00\x00"), 7)
+        self.assertInvalid(document(b"\x02s\x00\x02\x00\x00\x00ab"), 12)
+        self.assertInvalid(document(b"\x03d\x00\x04\x00\x00\x00"), 7)
+        self.assertInvalid(document(b"\x10i\x00\x01\x00\x00"), 7)
+
+    def test_utf8(self):
+        error = self.assertInvalid(document(b"\x0aa\xff\x00"), 6)
+        self.assertIn("element name", str(error))
+        error = self.assertInvalid(
+            document(b"\x02s\x00\x03\x00\x00\x00a\xe9\x00"), 12)
+        self.assertIn("string", str(error))
+
+    def test_types(self):
+        error = self.assertInvalid(document(b"\x06u\x00"), 4)
+        self.assertIn("0x06", str(error))
+        self.assertInvalid(document(b"\x08t\x00\x02"), 7)
+        self.assertInvalid(
+            document(b"\x05u\x00\x02\x00\x00\x00\x04ab"), 7)
+
+    def test_depth(self):
+        deep = dumps({"a": {"b": {"c": {}}}})
+        set_max_depth(3)
+        self.assertTrue(validate(dumps({"a": {"b": {}}})))
+        self.assertInvalid(deep, 21)
+
+    def test_corruption(self):
+        # Whatever the damage, validate answers with a boolean, and
+        # documents it accepts can be decoded. Datetimes are taken as
+        # millis, since ones out of the range of datetime are well-formed.
+        rng = random.Random(0)
+        for _ in range(2000):
+            data = bytearray(self.data)
+            for _ in range(rng.randint(1, 3)):
+                data[rng.randrange(len(data))] = rng.randrange(256)
+            if validate(bytes(data)):
+                loads(bytes(data), datetime_mode="millis")
+        for end in range(len(self.data)):
+            self.assertFalse(validate(self.data[:end]))
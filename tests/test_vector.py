@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+import struct
+from array import array
+from unittest import TestCase
+
+from bson import WIDE_VECTOR_SUBTYPE, compile_encoder, dumps, dumps_into, \
+    encode_binary_element, encoded_size, get_path, loads, \
+    set_wide_vector_decoding
+from bson.types import Vector
+
+
+def document(body):
+    return struct.pack("<i", len(body) + 5) + body + b"\x00"
+
+
+def binary(subtype, payload):
+    return document(b"\x05v\x00" + struct.pack("<iB", len(payload), subtype) +
+                    payload)
+
+
+class TestVector(TestCase):
+    def tearDown(self):
+        set_wide_vector_decoding(False)
+
+    def test_round_trip(self):
+        for values in (array("b", [1, -2, 127]), array("f", [0.5, -1.5]),
+                       array("f")):
+            doc = {u"v": Vector(values)}
+            data = dumps(doc)
+            self.assertEqual(len(data), encoded_size(doc))
+            for decoded in (loads(data)[u"v"], get_path(data, u"v"),
+                            loads(memoryview(data))[u"v"]):
+                self.assertEqual(decoded, values)
+                self.assertEqual(decoded.typecode, values.typecode)
+
+    def test_wide_round_trip(self):
+        set_wide_vector_decoding(True)
+        for values in (Vector([1, -2, 2 ** 31 - 1], u"int32").get_value(),
+                       array("d", [0.1, -1.5]), array("d")):
+            doc = {u"v": Vector(values)}
+            data = dumps(doc)
+            self.assertEqual(len(data), encoded_size(doc))
+            for decoded in (loads(data)[u"v"], get_path(data, u"v"),
+                            loads(memoryview(data))[u"v"]):
+                self.assertEqual(decoded, values)
+                self.assertEqual(decoded.itemsize, values.itemsize)
+
+    def test_wide_decoding_is_opt_in(self):
+        data = dumps({u"v": Vector([1.0], u"float64")})
+        payload = b"\x28\x00" + struct.pack("<d", 1.0)
+        self.assertEqual(loads(data), {u"v": payload})
+        set_wide_vector_decoding(True)
+        self.assertEqual(loads(data), {u"v": array("d", [1.0])})
+
+    def test_layout(self):
+        self.assertEqual(dumps({u"v": Vector([1, -2], u"int8")}),
+                         binary(0x09, b"\x03\x00\x01\xfe"))
+        self.assertEqual(dumps({u"v": Vector([1.0], u"float32")}),
+                         binary(0x09, b"\x27\x00\x00\x00\x80\x3f"))
+        self.assertEqual(dumps({u"v": Vector([1, -2], u"int32")}),
+                         binary(WIDE_VECTOR_SUBTYPE,
+                                b"\x04\x00\x01\x00\x00\x00"
+                                b"\xfe\xff\xff\xff"))
+        self.assertEqual(dumps({u"v": Vector([1.0], u"float64")}),
+                         binary(WIDE_VECTOR_SUBTYPE,
+                                b"\x28\x00" + struct.pack("<d", 1.0)))
+
+    def test_dumps_into(self):
+        doc = {u"v": Vector(array("f", [1.0, 2.0]))}
+        data = dumps(doc)
+        buf = bytearray(100)
+        self.assertEqual(dumps_into(doc, buf, 3), len(data))
+        self.assertEqual(buf[3:3 + len(data)], data)
+
+    def test_dtype(self):
+        self.assertEqual(Vector([1, 2], u"int8").get_value(),
+                         array("b", [1, 2]))
+        converted = Vector(array("d", [1.0]), u"float32").get_value()
+        self.assertEqual(converted, array("f", [1.0]))
+        self.assertEqual(converted.typecode, "f")
+        values = array("f", [1.0])
+        self.assertIs(Vector(values).get_value(), values)
+        with self.assertRaises(ValueError):
+            Vector([1, 2])
+        doubles = array("d", [1.0])
+        self.assertIs(Vector(doubles).get_value(), doubles)
+        with self.assertRaises(ValueError):
+            Vector(array("h", [1]))
+        with self.assertRaises(ValueError):
+            Vector([1, 2], u"int16")
+        with self.assertRaises(OverflowError):
+            Vector([300], u"int8")
+        with self.assertRaises(OverflowError):
+            Vector([2 ** 31], u"int32")
+
+    def test_smaller_than_array(self):
+        values = array("f", range(1000))
+        self.assertLess(len(dumps({u"v": Vector(values)})) * 3,
+                        len(dumps({u"v": values})))
+
+    def test_malformed(self):
+        # Left as bytes: wrong padding, unknown or packed-bit dtypes, and
+        # float32 payloads of a length that is not a multiple of 4.
+        for payload in (b"", b"\x03", b"\x03\x01\x01", b"\x10\x00\xff",
+                        b"\x28\x00\x00\x00\x00\x00", b"\x27\x00\x00\x00"):
+            self.assertEqual(loads(binary(0x09, payload)), {u"v": payload})
+
+    def test_user_defined_subtype(self):
+        for payload in (b"bar", b"f\x00\x00\x00\x80\x3f"):
+            data = binary(0x80, payload)
+            self.assertEqual(loads(data), {u"v": payload})
+            self.assertEqual(encode_binary_element(u"v", payload, 0x80),
+                             data[4:-1])
+        # Still bytes once wide vectors are decoded, unless they are
+        # well-formed int32 or float64 vectors.
+        set_wide_vector_decoding(True)
+        for payload in (b"bar", b"f\x00\x00\x00\x80\x3f",
+                        b"\x03\x00\x01", b"\x04\x00\x01\x00\x00",
+                        b"\x28\x01" + b"\x00" * 8):
+            self.assertEqual(loads(binary(0x80, payload)), {u"v": payload})
+
+    def test_compiled(self):
+        encode = compile_encoder({u"v": Vector})
+        for doc in ({u"v": Vector([1.5], u"float32")},
+                    {u"v": Vector([1.5], u"float64")}):
+            self.assertEqual(encode(doc), dumps(doc))